@@ -2,7 +2,7 @@
 import os
 from typing import Any, Dict, List, Optional, Tuple, TypedDict, TypeVar
 from auto_gpt_plugin_template import AutoGPTPluginTemplate
-from .bing_search import _bing_search
+from .bing_search import _bing_search, _bing_search_verticals
 
 PromptGenerator = TypeVar("PromptGenerator")
 
@@ -35,9 +35,24 @@ class AutoGPTBingSearch(AutoGPTPluginTemplate):
             prompt.add_command(
                 "Bing Search",
                 "bing_search",
-                {"query": "<query>"},
+                {
+                    "query": "<query>",
+                    "num_results": "<num_results>",
+                    "output_format": "<json|compact|jsonl|text>",
+                },
                 _bing_search,
             )
+            prompt.add_command(
+                "Bing Search Web, News, Images and Videos",
+                "bing_search_verticals",
+                {
+                    "query": "<query>",
+                    "verticals": "<comma separated web,news,images,videos>",
+                    "num_results": "<num_results>",
+                    "output_format": "<json|compact|jsonl|text>",
+                },
+                _bing_search_verticals,
+            )
         else:
             print(
                 "Warning: Bing-Search-Plugin is not fully functional. "
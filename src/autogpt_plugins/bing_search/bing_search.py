@@ -1,50 +1,327 @@
+from __future__ import annotations
+
 import requests
-import json
+import concurrent.futures
 import os
-import re
+import random
+import threading
+from typing import Iterator
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .result_format import format_results
+from .snippets import normalize_snippet, normalize_snippets
+from .cache import BingCache
+
+# Bing Search API endpoint
+BING_SEARCH_URL = "https://api.bing.microsoft.com/v7.0/search"
+# (connect, read) timeouts in seconds.
+BING_TIMEOUT = (3.05, 10)
+# Maximum number of Bing requests in flight in this process. The free tier
+# allows 3 transactions per second.
+BING_MAX_CONCURRENCY = int(os.getenv("BING_MAX_CONCURRENCY", "3"))
+# Verticals of the search endpoint, mapped to their `responseFilter` value and
+# the key of their answer in the response.
+BING_VERTICALS = {
+    "web": ("Webpages", "webPages"),
+    "news": ("News", "news"),
+    "images": ("Images", "images"),
+    "videos": ("Videos", "videos"),
+}
+# Maximum `count` accepted by the search API per request.
+BING_MAX_COUNT = 50
+# Bing does not return results past this offset.
+BING_MAX_OFFSET = 1000
+# Longest `Retry-After` honoured, in seconds, so a throttled query cannot stall
+# the agent for minutes.
+BING_MAX_RETRY_AFTER = 10
+
+_session = None
+_session_lock = threading.Lock()
+_concurrency = threading.BoundedSemaphore(BING_MAX_CONCURRENCY)
+_executor = None
+
+# Results are cached for BING_CACHE_TTL seconds. A TTL of 0 disables the cache.
+_cache = BingCache(
+    ttl=float(os.getenv("BING_CACHE_TTL", "900")),
+    max_entries=int(os.getenv("BING_CACHE_SIZE", "256")),
+)
+
+
+class _JitteredRetry(Retry):
+    """Retry with "full jitter" exponential backoff and a capped `Retry-After`.
+
+    Spreading retries randomly over the backoff window keeps several throttled
+    callers from retrying in lockstep.
+    """
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, BING_MAX_RETRY_AFTER)
+
+
+def _get_session() -> requests.Session:
+    """Return the module-level session shared by all Bing requests.
+
+    Connections are kept alive and pooled, so only the first query pays for
+    the TLS handshake. Queries that are throttled (429) or hit a server error
+    are retried, waiting for `Retry-After` when the API sends one.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = _JitteredRetry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=("GET",),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=BING_MAX_CONCURRENCY,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                _session = session
+    return _session
 
 
 def clean_text(text: str) -> str:
-    cleaned_text = re.sub("<[^>]*>", "", text)  # Remove HTML tags
-    cleaned_text = cleaned_text.replace(
-        "\\n", " "
-    )  # Replace newline characters with spaces
-    return cleaned_text
+    # Remove HTML tags, decode HTML entities and collapse whitespace
+    return normalize_snippet(text)
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Return the thread pool used to prefetch result pages."""
+    global _executor
+    if _executor is None:
+        with _session_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=BING_MAX_CONCURRENCY, thread_name_prefix="bing"
+                )
+    return _executor
+
 
+def _normalize_query(query: str) -> str:
+    """Return the form of a query used as cache key: case-folded, with runs of
+    whitespace collapsed."""
+    return " ".join(query.split()).casefold()
 
-def _bing_search(query: str, num_results=8) -> str:
+
+def _bing_search(query: str, num_results=8, output_format: str | None = None) -> str:
     """
-    Perform a Bing search and return the results as a JSON string.
+    Perform a Bing search and return the results as a JSON string, or in the
+    `output_format` chosen (see `result_format.py`).
+    More than 50 results are collected over several pages.
     """
-    subscription_key = os.getenv("BING_API_KEY")
+    search_results_list = list(_iter_bing_results(query, int(num_results)))
+
+    # Return the search results as a string
+    return format_results(search_results_list, output_format)
+
+
+def _iter_bing_results(query: str, num_results: int) -> Iterator[dict]:
+    """
+    Yield up to `num_results` search results with distinct URLs.
+
+    Pages of up to 50 results are requested with `offset`/`count`. While one
+    page is processed the next one is already being fetched, and results are
+    yielded as soon as their page arrives. Fetching stops once enough unique
+    results are collected or Bing runs out of results.
+    """
+    page_size = min(num_results, BING_MAX_COUNT)
+    if page_size <= 0:
+        return
+
+    def fetch(offset: int) -> concurrent.futures.Future:
+        return _get_executor().submit(_search_page, query, page_size, offset)
+
+    seen_urls = set()
+    offset = 0
+    pending = fetch(offset)
+    try:
+        while pending is not None:
+            page = pending.result()
+            offset += page_size
+            has_next = bool(page["results"]) and offset < min(
+                page["total_estimated"], BING_MAX_OFFSET
+            )
+            # Prefetch the next page unless this one can complete the results.
+            pending = None
+            if has_next and len(page["results"]) < num_results - len(seen_urls):
+                pending = fetch(offset)
 
-    # Bing Search API endpoint
-    search_url = "https://api.bing.microsoft.com/v7.0/search"
+            for result in page["results"]:
+                if result["href"] in seen_urls:
+                    continue
+                seen_urls.add(result["href"])
+                yield result
+                if len(seen_urls) >= num_results:
+                    return
+            if pending is None and has_next:
+                # Duplicate URLs left the results short after all.
+                pending = fetch(offset)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def _search_page(query: str, count: int, offset: int) -> dict:
+    """
+    Return one page of search results, from the cache when possible.
+    Repeated and concurrent identical requests share a single API call.
+    """
+    return _cache.get_or_fetch(
+        ("search", _normalize_query(query), count, offset),
+        lambda: _fetch_search_results(query, count, offset),
+    )
+
+
+def _fetch_search_results(query: str, num_results: int, offset: int = 0) -> dict:
+    """
+    Send a Bing search request and return the cleaned results together with
+    Bing's estimate of the total number of matches.
+    """
+    subscription_key = os.getenv("BING_API_KEY")
 
     headers = {"Ocp-Apim-Subscription-Key": subscription_key}
     params = {
         "q": query,
         "count": num_results,
+        "offset": offset,
         "textDecorations": True,
         "textFormat": "HTML",
     }
-    response = requests.get(search_url, headers=headers, params=params)
+    with _concurrency:
+        response = _get_session().get(
+            BING_SEARCH_URL, headers=headers, params=params, timeout=BING_TIMEOUT
+        )
     response.raise_for_status()
     search_results = response.json()
 
     # Extract the search result items from the response
     web_pages = search_results.get("webPages", {})
     search_results = web_pages.get("value", [])
+    total_estimated = web_pages.get("totalEstimatedMatches", 0)
+
+    # Clean all titles and snippets in one batch
+    texts = normalize_snippets(
+        [text for item in search_results for text in (item["name"], item["snippet"])]
+    )
 
     # Create a list of search result dictionaries with 'title', 'href', and 'body' keys
     search_results_list = [
         {
-            "title": clean_text(item["name"]),
+            "title": texts[2 * i],
             "href": item["url"],
-            "body": clean_text(item["snippet"]),
+            "body": texts[2 * i + 1],
         }
-        for item in search_results
+        for i, item in enumerate(search_results)
     ]
+    return {"results": search_results_list, "total_estimated": total_estimated}
+
+
+def _bing_search_verticals(
+    query: str,
+    verticals: str | list = "web,news,images,videos",
+    num_results=5,
+    output_format: str | None = None,
+) -> str:
+    """
+    Search several Bing verticals at once and return the results as a JSON
+    string with one list per vertical, or in the `output_format` chosen.
+
+    All verticals are requested in a single call to the search endpoint with
+    `responseFilter`, so the lookup costs one round-trip and one transaction.
+    """
+    if isinstance(verticals, str):
+        verticals = verticals.split(",")
+    verticals = list(dict.fromkeys(v.strip().lower() for v in verticals if v.strip()))
+    unknown = [vertical for vertical in verticals if vertical not in BING_VERTICALS]
+    if unknown or not verticals:
+        raise ValueError(
+            f"Unknown verticals {unknown}, choose from {list(BING_VERTICALS)}"
+        )
+
+    results = _cache.get_or_fetch(
+        ("verticals", _normalize_query(query), tuple(verticals), int(num_results)),
+        lambda: _fetch_verticals(query, verticals, int(num_results)),
+    )
+    return format_results(results, output_format)
+
+
+def _fetch_verticals(query: str, verticals: list, num_results: int) -> dict:
+    """
+    Send one search request for all `verticals` and return compact, cleaned
+    results for each of them.
+    """
+    headers = {"Ocp-Apim-Subscription-Key": os.getenv("BING_API_KEY")}
+    params = {
+        "q": query,
+        "count": min(num_results, BING_MAX_COUNT),
+        "responseFilter": ",".join(BING_VERTICALS[v][0] for v in verticals),
+        "textDecorations": True,
+        "textFormat": "HTML",
+    }
+    with _concurrency:
+        response = _get_session().get(
+            BING_SEARCH_URL, headers=headers, params=params, timeout=BING_TIMEOUT
+        )
+    response.raise_for_status()
+    search_results = response.json()
+
+    items = {
+        vertical: search_results.get(BING_VERTICALS[vertical][1], {}).get(
+            "value", []
+        )[:num_results]
+        for vertical in verticals
+    }
+    # Clean all titles and descriptions in one batch
+    texts = iter(
+        normalize_snippets(
+            [
+                text
+                for vertical in verticals
+                for item in items[vertical]
+                for text in (
+                    item.get("name", ""),
+                    item.get("snippet", item.get("description", "")),
+                )
+            ]
+        )
+    )
 
-    # Return the search results as a JSON string
-    return json.dumps(search_results_list, ensure_ascii=False, indent=4)
+    results = {}
+    for vertical in verticals:
+        results[vertical] = []
+        for item in items[vertical]:
+            result = {"title": next(texts)}
+            body = next(texts)
+            if vertical == "images":
+                result["href"] = item.get("hostPageUrl")
+                result["image"] = item.get("contentUrl")
+            elif vertical == "videos":
+                result["href"] = item.get("hostPageUrl") or item.get("contentUrl")
+            else:
+                result["href"] = item.get("url")
+            if body:
+                result["body"] = body
+            if "provider" in item and item["provider"]:
+                result["source"] = item["provider"][0].get("name")
+            elif "publisher" in item and item["publisher"]:
+                result["source"] = item["publisher"][0].get("name")
+            if "datePublished" in item:
+                result["date"] = item["datePublished"]
+            results[vertical].append(result)
+    return results
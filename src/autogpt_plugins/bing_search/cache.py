@@ -0,0 +1,94 @@
+"""In-memory cache for Bing search results."""
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+
+class BingCache:
+    """
+    A TTL cache with an LRU bound and request coalescing.
+
+    Entries are fresh for `ttl` seconds, and at most `max_entries` are kept.
+    While a key is being fetched, other callers asking for the same key wait
+    for that fetch instead of starting their own (singleflight), so identical
+    concurrent queries cost a single API call.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = collections.OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, calling `fetch` on a miss.
+        Args:
+            key (Hashable): The normalized cache key.
+            fetch (Callable[[], Any]): Returns the live value.
+        Returns:
+            Any: The cached or freshly fetched value.
+        """
+        if not self.enabled:
+            return fetch()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                self.misses += 1
+                future = self._inflight[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if inflight is not None:
+            # Another caller is fetching this key; wait for its result.
+            return inflight.result()
+
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        """Return the hit, miss and coalesced request counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "entries": len(self._entries),
+            }
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = 0
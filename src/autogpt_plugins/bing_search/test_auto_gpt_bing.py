@@ -1,9 +1,21 @@
+import json
 import os
 import requests
+import threading
+import time
 import unittest
 from typing import List
+from unittest.mock import MagicMock, patch
 from . import AutoGPTBingSearch
-from .bing_search import _bing_search
+from .snippets import normalize_snippets
+from .cache import BingCache
+from .bing_search import (
+    BING_MAX_RETRY_AFTER,
+    _bing_search,
+    _bing_search_verticals,
+    _get_session,
+    clean_text,
+)
 
 
 class TestAutoGPTBingSearch(unittest.TestCase):
@@ -23,6 +35,148 @@ class TestAutoGPTBingSearch(unittest.TestCase):
         except requests.exceptions.HTTPError as e:
             self.assertEqual(e.response.status_code, 401)
 
+    def test_clean_text(self):
+        self.assertEqual(
+            clean_text("<b>Tom &amp; Jerry</b>\\n  cartoon&#39;s  &unknown;"),
+            "Tom & Jerry cartoon's &unknown;",
+        )
+        # An unclosed tag does not swallow the next snippet of the batch
+        self.assertEqual(
+            normalize_snippets(["a <b", "c>  &lt;d&gt;\tx"]), ["a <b", "c> <d> x"]
+        )
+        # Neither does a snippet containing the batch separator
+        self.assertEqual(normalize_snippets(["a\x00<i>b</i>", "c"]), ["a\x00b", "c"])
+
+    def test_session_is_shared(self):
+        session = _get_session()
+        self.assertIs(session, _get_session())
+
+        retry = session.get_adapter("https://api.bing.microsoft.com").max_retries
+        self.assertIn(429, retry.status_forcelist)
+        self.assertTrue(retry.respect_retry_after_header)
+        response = MagicMock(headers={"Retry-After": "3600"})
+        self.assertEqual(retry.get_retry_after(response), BING_MAX_RETRY_AFTER)
+
+    def test_cache_coalesces_identical_queries(self):
+        cache = BingCache(ttl=60)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return [{"title": "result"}]
+
+        threads = [
+            threading.Thread(target=cache.get_or_fetch, args=("key", fetch))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.get_or_fetch("key", fetch), [{"title": "result"}])
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.coalesced + cache.hits, 5)
+
+    def test_bing_search_normalizes_cache_key(self):
+        with patch(
+            "autogpt_plugins.bing_search.bing_search._fetch_search_results",
+            return_value={"results": [], "total_estimated": 0},
+        ) as fetch:
+            _bing_search("Cached  Query")
+            _bing_search(" cached query ")
+        fetch.assert_called_once()
+
+    def test_bing_search_pages_and_dedupes(self):
+        def fetch(query, count, offset):
+            # Every page repeats the last URL of the previous page.
+            results = [
+                {"title": "", "href": f"https://example.com/{i}", "body": ""}
+                for i in range(max(offset - 1, 0), offset + count - 1)
+            ]
+            return {"results": results, "total_estimated": 200}
+
+        with patch(
+            "autogpt_plugins.bing_search.bing_search._fetch_search_results",
+            side_effect=fetch,
+        ) as fetch_mock:
+            results = json.loads(_bing_search("paged query", 120))
+
+        urls = [result["href"] for result in results]
+        self.assertEqual(len(urls), 120)
+        self.assertEqual(len(set(urls)), 120)
+        self.assertEqual(
+            [call.args[2] for call in fetch_mock.call_args_list], [0, 50, 100]
+        )
+
+    def test_bing_search_verticals(self):
+        response = MagicMock()
+        response.json.return_value = {
+            "webPages": {
+                "value": [
+                    {"name": "<b>Web</b>", "url": "https://w", "snippet": "a &amp; b"}
+                ]
+            },
+            "news": {
+                "value": [
+                    {
+                        "name": "News",
+                        "url": "https://n",
+                        "description": "story",
+                        "provider": [{"name": "Wire"}],
+                        "datePublished": "2023-05-01T00:00:00",
+                    }
+                ]
+            },
+        }
+        with patch(
+            "autogpt_plugins.bing_search.bing_search._get_session"
+        ) as get_session:
+            get_session.return_value.get.return_value = response
+            results = json.loads(_bing_search_verticals("verticals query", "web, news"))
+
+        params = get_session.return_value.get.call_args.kwargs["params"]
+        self.assertEqual(params["responseFilter"], "Webpages,News")
+        self.assertEqual(
+            results,
+            {
+                "web": [{"title": "Web", "href": "https://w", "body": "a & b"}],
+                "news": [
+                    {
+                        "title": "News",
+                        "href": "https://n",
+                        "body": "story",
+                        "source": "Wire",
+                        "date": "2023-05-01T00:00:00",
+                    }
+                ],
+            },
+        )
+        with self.assertRaises(ValueError):
+            _bing_search_verticals("verticals query", "maps")
+
+    def test_bing_search_output_formats(self):
+        page = {
+            "results": [
+                {"title": "Title", "href": "https://a", "body": "one two three"}
+            ],
+            "total_estimated": 1,
+        }
+        with patch(
+            "autogpt_plugins.bing_search.bing_search._fetch_search_results",
+            return_value=page,
+        ):
+            compact = _bing_search("format query", 1, output_format="compact")
+            text = _bing_search("format query", 1, output_format="text")
+            with self.assertRaises(ValueError):
+                _bing_search("format query", 1, output_format="xml")
+
+        self.assertEqual(json.loads(compact), page["results"])
+        self.assertNotIn(" ", compact.replace("one two three", ""))
+        self.assertEqual(text, "Title | https://a | one two three")
+
     def test_pre_command(self):
         os.environ["SEARCH_ENGINE"] = "bing"
         self.plugin = AutoGPTBingSearch()
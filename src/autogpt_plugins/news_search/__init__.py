@@ -2,7 +2,10 @@
 import os
 from typing import Any, Dict, List, Optional, Tuple, TypedDict, TypeVar
 from auto_gpt_plugin_template import AutoGPTPluginTemplate
+from .cache import NewsCache
 from .news_search import NewsSearch
+from .planner import RequestPlanner
+from .store import NewsStore
 
 PromptGenerator = TypeVar("PromptGenerator")
 
@@ -21,7 +24,17 @@ class AutoGPTNewsSearch(AutoGPTPluginTemplate):
             "This plugin searches the latest news using the provided query and the newsapi aggregator"
         )
         self.load_commands = (os.getenv("NEWSAPI_API_KEY")) # Wrapper, if more variables are needed in future
-        self.news_search = NewsSearch(os.getenv("NEWSAPI_API_KEY"))
+        self.news_search = NewsSearch(
+            os.getenv("NEWSAPI_API_KEY"),
+            planner=RequestPlanner.from_env(),
+            cache=NewsCache.from_env(),
+            store=NewsStore.from_env(),
+        )
+        if self.load_commands:
+            # Keeps the query-less top headlines of every category warm.
+            self.news_search.start_warmup(
+                float(os.getenv("NEWSAPI_WARMUP_INTERVAL", "0"))
+            )
 
     def can_handle_post_prompt(self) -> bool:
         return True
@@ -35,6 +48,25 @@ class AutoGPTNewsSearch(AutoGPTPluginTemplate):
                 {"query": "<query>"},
                 self.news_search.news_search,
             )
+            prompt.add_command(
+                "News Search All Articles",
+                "news_everything",
+                {
+                    "query": "<query>",
+                    "from_date": "<YYYY-MM-DD>",
+                    "to_date": "<YYYY-MM-DD>",
+                    "sources": "<comma separated source ids>",
+                    "sort_by": "<publishedAt, relevancy or popularity>",
+                    "limit": "<max number of articles>",
+                },
+                self.news_search.news_everything,
+            )
+            prompt.add_command(
+                "Search Previously Fetched News",
+                "search_local_news",
+                {"query": "<query>", "limit": "<max number of articles>"},
+                self.news_search.search_local_news,
+            )
         else:
             print(
                 "Warning: News-Search-Plugin is not fully functional. "
@@ -0,0 +1,131 @@
+"""Latency benchmark for `NewsSearch.news_search`.
+
+Runs `news_search` against a local HTTP stand-in for NewsAPI that answers
+each request after `--latency-ms`, and delays every new connection by
+`--handshake-ms` to stand in for the TCP and TLS setup of a real connection
+to newsapi.org. It is timed once the way it used to run, with a new thread
+pool and unpooled connections per query, and once with the persistent pool
+and keep-alive session.
+
+Usage:
+    python -m autogpt_plugins.news_search.benchmark_news_search
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import json
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from newsapi import NewsApiClient, const
+
+from . import news_search
+
+HEADLINES_RESPONSE = json.dumps(
+    {
+        "status": "ok",
+        "totalResults": 3,
+        "articles": [{"title": f"Headline {i}"} for i in range(3)],
+    }
+).encode()
+
+
+class _NewsApiStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(HEADLINES_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(HEADLINES_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class _HandshakeDelayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    handshake_delay = 0.0
+
+    def get_request(self):
+        # Headers and body are written separately; disable Nagle so keep-alive
+        # responses are not held back by delayed ACKs.
+        request, client_address = super().get_request()
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return request, client_address
+
+    def process_request_thread(self, request, client_address):
+        time.sleep(self.handshake_delay)
+        super().process_request_thread(request, client_address)
+
+
+def _previous_news_search(search: news_search.NewsSearch, query: str) -> list:
+    """`news_search` as it used to run: a new thread pool per query."""
+    with concurrent.futures.ThreadPoolExecutor() as tp:
+        futures = [
+            tp.submit(search.news_headlines_search, category=cat, query=query)
+            for cat in news_search.categories
+        ]
+        return [fut.result() for fut in concurrent.futures.wait(futures)[0]]
+
+
+def _time_queries(search_function, queries: int) -> list[float]:
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        search_function(f"query {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def _report(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<10} mean {statistics.mean(latencies):7.2f} ms   "
+        f"p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    _NewsApiStandIn.latency = args.latency_ms / 1000
+    server = _HandshakeDelayServer(("127.0.0.1", 0), _NewsApiStandIn)
+    server.handshake_delay = args.handshake_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v2/top-headlines"
+
+    with patch.object(const, "TOP_HEADLINES_URL", url):
+        previous = news_search.NewsSearch("benchmark")
+        previous.news_api_client = NewsApiClient("benchmark")
+        before = _time_queries(
+            lambda query: _previous_news_search(previous, query), args.queries
+        )
+        previous.close()
+
+        search = news_search.NewsSearch("benchmark")
+        search.news_search("warm-up")
+        after = _time_queries(search.news_search, args.queries)
+        search.close()
+
+    server.shutdown()
+    _report("previous", before)
+    _report("persistent", after)
+    print(f"speed-up {statistics.mean(before) / statistics.mean(after):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Two-tier cache for NewsAPI responses."""
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NewsCache:
+    """
+    An in-memory LRU in front of an on-disk SQLite store, with a short TTL.
+
+    While a key is being fetched, other callers asking for the same key wait
+    for that fetch instead of starting their own, so concurrent identical
+    lookups cost a single request. Values must be JSON serializable.
+    """
+
+    def __init__(self, path: Optional[str], ttl: float, max_entries: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = None
+
+    @classmethod
+    def from_env(cls) -> "NewsCache":
+        return cls(
+            path=os.getenv("NEWSAPI_CACHE_PATH")
+            or os.path.join(
+                os.path.expanduser("~"), ".cache", "autogpt_plugins", "newsapi.sqlite3"
+            ),
+            ttl=float(os.getenv("NEWSAPI_CACHE_TTL", "300")),
+            max_entries=int(os.getenv("NEWSAPI_CACHE_SIZE", "256")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, calling `fetch` on a miss.
+        Args:
+            key (Hashable): The normalized cache key.
+            fetch (Callable[[], Any]): Returns the live value.
+        Returns:
+            Any: The cached or freshly fetched value.
+        """
+        if not self.enabled:
+            return fetch()
+
+        cache_key = json.dumps(key, ensure_ascii=False)
+        with self._lock:
+            value = self._get(cache_key)
+            if value is not None:
+                self.hits += 1
+                return value[0]
+            inflight = self._inflight.get(cache_key)
+            if inflight is None:
+                self.misses += 1
+                future = self._inflight[cache_key] = concurrent.futures.Future()
+        if inflight is not None:
+            # Another caller is fetching this key; wait for its result.
+            return inflight.result()
+
+        # Whatever happens, release the waiters and the in-flight slot, or the
+        # next lookup of this key would wait forever.
+        try:
+            value = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[cache_key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`. If the SQLite store cannot be written,
+        the value is only kept in memory.
+        Args:
+            key (Hashable): The normalized cache key.
+            value (Any): The JSON serializable value.
+        """
+        if not self.enabled:
+            return
+        cache_key = json.dumps(key, ensure_ascii=False)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(cache_key, (value, stored_at))
+            try:
+                db = self._connect()
+                if db is None:
+                    return
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at) "
+                    "VALUES (?, ?, ?)",
+                    (cache_key, json.dumps(value, ensure_ascii=False), stored_at),
+                )
+                db.execute(
+                    "DELETE FROM cache WHERE stored_at < ?", (stored_at - self.ttl,)
+                )
+                db.commit()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Could not write the NewsAPI cache %s: %s", self.path, e)
+
+    def _get(self, cache_key: str) -> Optional[tuple]:
+        """Return `(value,)` if there is a fresh entry. Callers must hold the
+        lock."""
+        entry = self._memory.get(cache_key)
+        if entry is None:
+            row = None
+            try:
+                db = self._connect()
+                if db is not None:
+                    row = db.execute(
+                        "SELECT value, stored_at FROM cache WHERE key = ?",
+                        (cache_key,),
+                    ).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Could not read the NewsAPI cache %s: %s", self.path, e)
+            if row is None:
+                return None
+            entry = (json.loads(row[0]), row[1])
+            self._remember(cache_key, entry)
+        if time.time() - entry[1] > self.ttl:
+            return None
+        self._memory.move_to_end(cache_key)
+        return (entry[0],)
+
+    def _remember(self, cache_key: str, entry: tuple) -> None:
+        self._memory[cache_key] = entry
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite store on first use. Callers must hold the lock."""
+        if self._db is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+        return self._db
@@ -0,0 +1,89 @@
+"""Merging of news headlines that report the same story."""
+from __future__ import annotations
+
+import random
+import re
+import zlib
+from typing import Dict, List
+
+# Headlines whose estimated Jaccard similarity reaches this are merged.
+NEAR_DUPLICATE_THRESHOLD = 0.55
+NUM_PERMUTATIONS = 64
+SHINGLE_LENGTH = 4
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+# NewsAPI titles usually end with " - <source name>".
+_SOURCE_SUFFIX = re.compile(r"\s+[-|]\s+[^-|]{1,60}$")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def merge_headlines(results: Dict[str, List[dict]]) -> List[dict]:
+    """Flatten per-category articles into one list without duplicate stories.
+
+    Headlines that are equal once normalized, or whose MinHash signatures
+    estimate a Jaccard similarity of at least `NEAR_DUPLICATE_THRESHOLD`
+    over their character shingles, are merged into the first of them. The
+    merged entry keeps the categories and URLs of all of them.
+
+    Args:
+        results (Dict[str, List[dict]]): Articles with `title` and `url`
+                                         keys, by category.
+
+    Returns:
+        List[dict]: Dictionaries with `title`, `urls` and `categories` keys,
+                    in the order the stories were first seen.
+    """
+    merged = []
+    by_title = {}
+    signatures = []
+    for category, articles in results.items():
+        for article in articles:
+            title = article["title"]
+            normalized = normalize_title(title)
+            entry = by_title.get(normalized)
+            if entry is None:
+                signature = minhash(normalized)
+                entry = _find_near_duplicate(signature, signatures)
+                if entry is None:
+                    entry = {"title": title, "urls": [], "categories": []}
+                    merged.append(entry)
+                    signatures.append((signature, entry))
+                by_title[normalized] = entry
+            if category not in entry["categories"]:
+                entry["categories"].append(category)
+            url = article.get("url")
+            if url and url not in entry["urls"]:
+                entry["urls"].append(url)
+    return merged
+
+
+def normalize_title(title: str) -> str:
+    """Lowercase a headline, drop its trailing source name and punctuation."""
+    title = _SOURCE_SUFFIX.sub("", title)
+    return _NON_WORD.sub(" ", title.lower()).strip()
+
+
+def minhash(text: str) -> List[int]:
+    """Return the MinHash signature of the character shingles of `text`."""
+    if len(text) <= SHINGLE_LENGTH:
+        shingles = {text}
+    else:
+        shingles = {
+            text[i : i + SHINGLE_LENGTH]
+            for i in range(len(text) - SHINGLE_LENGTH + 1)
+        }
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _find_near_duplicate(signature: List[int], signatures: List[tuple]):
+    for other, entry in signatures:
+        same = sum(x == y for x, y in zip(signature, other))
+        if same >= NEAR_DUPLICATE_THRESHOLD * NUM_PERMUTATIONS:
+            return entry
+    return None
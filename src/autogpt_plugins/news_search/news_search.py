@@ -1,14 +1,188 @@
 import concurrent.futures
-from typing import List
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Any, Dict, Iterator, List, Optional
 
+import requests
 from newsapi import NewsApiClient
+from newsapi.newsapi_exception import NewsAPIException
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .result_format import format_results
+from .cache import NewsCache
+from .dedupe import merge_headlines
+from .planner import RequestPlanner
+from .store import NewsStore
 
 categories = ["technology", "business", "entertainment", "health", "sports", "science"]
 
+# (connect, read) timeouts in seconds for each NewsAPI request.
+NEWSAPI_TIMEOUT = (3.05, 10)
+# Seconds `news_search` waits for all categories before giving up on the rest.
+NEWSAPI_DEADLINE = float(os.getenv("NEWSAPI_DEADLINE", "10"))
+# Key of the results of a single `get_everything` request.
+EVERYTHING = "everything"
+NEWS_COUNTRY = "us"
+# Maximum `pageSize` accepted by NewsAPI.
+NEWSAPI_MAX_PAGE_SIZE = 100
+NEWS_LANGUAGE = "en"
+
+
+class _NewsApiSession(requests.Session):
+    """
+    A keep-alive session for the NewsAPI client. The client always asks for a
+    30 second timeout; this session applies `NEWSAPI_TIMEOUT` instead.
+    """
+
+    def request(self, *args, **kwargs):
+        kwargs["timeout"] = NEWSAPI_TIMEOUT
+        return super().request(*args, **kwargs)
+
+
+def _create_session() -> requests.Session:
+    retry = Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=len(categories), max_retries=retry
+    )
+    session = _NewsApiSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class NewsSearch(object):
 
-    def __init__(self, api_key):
-        self.news_api_client = NewsApiClient(api_key)
+    def __init__(
+        self,
+        api_key,
+        planner: Optional[RequestPlanner] = None,
+        cache: Optional[NewsCache] = None,
+        store: Optional[NewsStore] = None,
+    ):
+        # Without a planner every search queries all categories, and without
+        # a cache every lookup is sent to NewsAPI. Fetched articles are kept
+        # in the store for `search_local_news`.
+        self.planner = planner
+        self.cache = cache
+        self.store = store
+        self._stop = threading.Event()
+        self.session = _create_session()
+        self.news_api_client = NewsApiClient(api_key, session=self.session)
+        # One long-lived pool, so thread start-up is not paid on every query.
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(categories), thread_name_prefix="news-search"
+        )
+        # Futures that have not finished yet, cancelled on close.
+        self._futures = set()
+        # Shut the pool down and close connections when the plugin is
+        # unloaded, or at the latest when the interpreter exits.
+        self._finalizer = weakref.finalize(
+            self,
+            NewsSearch._release,
+            self.executor,
+            self._futures,
+            self.session,
+            self._stop,
+        )
+
+    @staticmethod
+    def _release(executor, futures, session, stop):
+        stop.set()
+        # `shutdown(cancel_futures=True)` needs Python 3.9.
+        for future in list(futures):
+            future.cancel()
+        executor.shutdown(wait=False)
+        session.close()
+
+    def _submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """Run `fn` on the pool, tracking the future until it is done."""
+        future = self.executor.submit(fn, *args, **kwargs)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def close(self):
+        """
+        Stop the worker threads and close the HTTP connections.
+        """
+        self._finalizer()
+
+    def start_warmup(self, interval: float) -> bool:
+        """
+        Refresh the query-less top headlines of every category in the cache
+        every `interval` seconds, in a background thread, until closed.
+        Returns:
+            bool: Whether the refresher was started. It needs an enabled cache.
+        """
+        if self.cache is None or not self.cache.enabled or interval <= 0:
+            return False
+        threading.Thread(
+            target=NewsSearch._warm,
+            args=(weakref.ref(self), self._stop, interval),
+            name="news-warmup",
+            daemon=True,
+        ).start()
+        return True
+
+    @staticmethod
+    def _warm(search_ref, stop, interval):
+        # Only a weak reference is held between rounds, so the refresher does
+        # not keep an unloaded plugin alive.
+        while not stop.is_set():
+            search = search_ref()
+            if search is None:
+                return
+            planner = search.planner
+            if planner is None or planner.remaining >= planner.low_quota:
+                for cat in categories:
+                    try:
+                        articles = search._fetch_top_headlines(cat, "")
+                        search.cache.set(_headlines_key(cat, ""), articles)
+                    except Exception:
+                        # Keep the previous entry; the next round retries.
+                        pass
+            del search
+            stop.wait(interval)
+
+    def _fetch_top_headlines(self, category: str, query: str) -> List[dict]:
+        if self.planner is not None:
+            self.planner.count_requests(1)
+        result = self.news_api_client.get_top_headlines(
+            category=category,
+            language=NEWS_LANGUAGE,
+            country=NEWS_COUNTRY,
+            page=1,
+            q=query or None,
+        )
+        self._store_articles(result["articles"], category)
+        return [_article(article) for article in result["articles"][:3]]
+
+    def _fetch_everything(self, query: str) -> List[dict]:
+        if self.planner is not None:
+            self.planner.count_requests(1)
+        result = self.news_api_client.get_everything(
+            q=query, language=NEWS_LANGUAGE, sort_by="relevancy", page=1, page_size=10
+        )
+        self._store_articles(result["articles"])
+        return [_article(article) for article in result["articles"]]
+
+    def _store_articles(self, articles: List[dict], category: Optional[str] = None):
+        if self.store is None:
+            return
+        try:
+            self.store.add(articles, category)
+        except (sqlite3.Error, OSError):
+            # The local store is an extra; never fail a search because of it.
+            pass
 
     def news_headlines_search(self, category: str, query: str) -> List[str]:
         """
@@ -18,25 +192,269 @@ class NewsSearch(object):
         Returns:
             list(str): A list of top news headlines for the specified category.
         """
-        result = self.news_api_client.get_top_headlines(
-            category=category, language="en", country="us", page=1, q=query
+        return [article["title"] for article in self.category_articles(category, query)]
+
+    def category_articles(self, category: str, query: str) -> List[dict]:
+        """
+        Get the top news articles for category specified.
+        Returns:
+            list(dict): Up to 3 articles with `title` and `url` keys.
+        """
+        if self.cache is None:
+            return self._fetch_top_headlines(category, query)
+        return self.cache.get_or_fetch(
+            _headlines_key(category, query),
+            lambda: self._fetch_top_headlines(category, query),
+        )
+
+    def news_everything_search(self, query: str) -> List[str]:
+        """
+        Get the most relevant recent headlines for the query across all sources.
+        Args:
+            query (str) : The search query.
+        Returns:
+            list(str): A list of headlines.
+        """
+        return [article["title"] for article in self.everything_articles(query)]
+
+    def everything_articles(self, query: str) -> List[dict]:
+        """
+        Get the most relevant recent articles for the query across all sources.
+        Returns:
+            list(dict): Up to 10 articles with `title` and `url` keys.
+        """
+        if self.cache is None:
+            return self._fetch_everything(query)
+        return self.cache.get_or_fetch(
+            (EVERYTHING, _normalize_query(query), NEWS_LANGUAGE),
+            lambda: self._fetch_everything(query),
         )
-        return [article["title"] for article in result["articles"][:3]]
 
+    def news_everything(
+        self,
+        query: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        sources: Optional[str] = None,
+        sort_by: str = "publishedAt",
+        limit: int = 20,
+        output_format: Optional[str] = None,
+    ) -> str:
+        """
+        Search all articles, not only top headlines, and return compact records.
+        Args:
+            query (str) : The search query.
+            from_date (str) : Oldest publication date, `YYYY-MM-DD`.
+            to_date (str) : Newest publication date, `YYYY-MM-DD`.
+            sources (str) : Comma separated NewsAPI source ids.
+            sort_by (str) : `publishedAt`, `relevancy` or `popularity`.
+            limit (int) : Maximum number of articles.
+            output_format (str) : See `result_format.py`.
+        Returns:
+            str: The articles, as `{"title", "url", "source", "date", "body"}`
+                 records in the chosen output format.
+        """
+        if self.planner is not None and self.planner.remaining <= 0:
+            return "Error: the NewsAPI daily request quota is used up."
+        articles = self.iter_everything(
+            query,
+            from_date=from_date or None,
+            to_date=to_date or None,
+            sources=sources or None,
+            sort_by=sort_by or "publishedAt",
+            limit=int(limit),
+        )
+        return format_results(list(articles), output_format)
 
-    def news_search(self, query: str) -> List[str]:
+    def iter_everything(
+        self,
+        query: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        sources: Optional[str] = None,
+        sort_by: str = "publishedAt",
+        limit: int = 20,
+    ) -> Iterator[dict]:
+        """
+        Yield up to `limit` articles matching the query, page by page.
+        While a page is processed the next one is already being fetched, and
+        articles are yielded as soon as their page arrives. Articles with a URL
+        already seen are skipped.
+        Paging stops early when the planner's daily quota is used up, or when a
+        page after the first fails, for example because the NewsAPI plan caps
+        how many results can be paged through. The articles of the earlier
+        pages are kept.
+        """
+        page_size = min(limit, NEWSAPI_MAX_PAGE_SIZE)
+        if page_size <= 0:
+            return
+        params = {
+            "q": query,
+            "from_param": from_date,
+            "to": to_date,
+            "sources": sources,
+            "sort_by": sort_by,
+            "page_size": page_size,
+        }
+
+        def fetch(page: int) -> Optional[concurrent.futures.Future]:
+            if self.planner is not None and self.planner.remaining <= 0:
+                return None
+            return self._submit(self._everything_page, params, page)
+
+        seen_urls = set()
+        page = 1
+        pending = fetch(page)
+        try:
+            while pending is not None:
+                try:
+                    articles, total = pending.result()
+                except (NewsAPIException, requests.RequestException):
+                    if page == 1:
+                        raise
+                    return
+                has_next = len(articles) == page_size and page * page_size < total
+                page += 1
+                pending = None
+                if has_next and len(articles) < limit - len(seen_urls):
+                    pending = fetch(page)
+
+                for article in articles:
+                    if article["url"] in seen_urls:
+                        continue
+                    seen_urls.add(article["url"])
+                    yield article
+                    if len(seen_urls) >= limit:
+                        return
+                if pending is None and has_next:
+                    # Duplicate URLs left the results short after all.
+                    pending = fetch(page)
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    def _everything_page(self, params: dict, page: int) -> tuple:
+        """Return the compact articles of one page and the total number of
+        results, from the cache when possible."""
+        if self.cache is None:
+            return self._fetch_everything_page(params, page)
+        key = ("everything-page", _normalize_query(params["q"]), page) + tuple(
+            params[name] for name in sorted(params) if name != "q"
+        )
+        return tuple(
+            self.cache.get_or_fetch(
+                key, lambda: self._fetch_everything_page(params, page)
+            )
+        )
+
+    def _fetch_everything_page(self, params: dict, page: int) -> tuple:
+        if self.planner is not None:
+            self.planner.count_requests(1)
+        result = self.news_api_client.get_everything(
+            language=NEWS_LANGUAGE, page=page, **params
+        )
+        self._store_articles(result["articles"])
+        articles = [
+            {
+                "title": article["title"],
+                "url": article["url"],
+                "source": (article.get("source") or {}).get("name"),
+                "date": article.get("publishedAt"),
+                "body": article.get("description"),
+            }
+            for article in result["articles"]
+        ]
+        return articles, result.get("totalResults", 0)
+
+    def search_local_news(
+        self, query: str, limit: int = 10, output_format: Optional[str] = None
+    ) -> str:
+        """
+        Search the articles fetched earlier, without using NewsAPI.
+        Matches are ranked by BM25 and favour recent articles.
+        Args:
+            query (str) : The search query.
+            limit (int) : Maximum number of articles.
+            output_format (str) : See `result_format.py`.
+        Returns:
+            str: The articles, as `{"title", "url", "source", "date", "body"}`
+                 records in the chosen output format.
+        """
+        if self.store is None:
+            return "The local news store is not enabled."
+        try:
+            articles = self.store.search(query, int(limit))
+        except (sqlite3.Error, OSError) as e:
+            return f"Error: the local news store could not be searched: {e}"
+        return format_results(articles, output_format)
+
+    def news_search(self, query: str) -> Dict[str, Any]:
         """
         Aggregates top news headlines from the categories.
+        With a planner, only the categories the planner picks are queried, or
+        a single search across all sources, labelled `"everything"`.
+        The same story reported in several categories, or reworded by several
+        sources, is returned once with all its categories and URLs.
+        Waits at most `NEWSAPI_DEADLINE` seconds. Categories that have not
+        answered by then are listed under `"pending"`, and categories whose
+        request failed under `"errors"`, without affecting the others.
         Returns:
-            list(str): A list of top news headlines aggregated from all categories.
+            dict: `{"headlines": [{"title": <title>, "urls": [<url>, ...],
+                  "categories": [<category>, ...]}, ...]}`, with `"pending"`
+                  and `"errors"` keys when there are any.
         """
-        with concurrent.futures.ThreadPoolExecutor() as tp:
-            futures = []
-            for cat in categories:
-                futures.append(tp.submit(self.news_headlines_search, category=cat, query=query))
+        if self.planner is None:
+            planned_categories, everything = categories, False
+        else:
+            plan = self.planner.plan(query)
+            if not plan.requests:
+                return {"error": "the NewsAPI daily request quota is used up"}
+            planned_categories, everything = plan.categories, plan.everything
+
+        futures = {
+            cat: self._submit(self.category_articles, category=cat, query=query)
+            for cat in planned_categories
+        }
+        if everything:
+            futures[EVERYTHING] = self._submit(self.everything_articles, query=query)
+        concurrent.futures.wait(futures.values(), timeout=NEWSAPI_DEADLINE)
+
+        articles = {}
+        pending = []
+        errors = {}
+        for cat, fut in futures.items():
+            if not fut.done():
+                fut.cancel()
+                pending.append(cat)
+            elif fut.exception() is not None:
+                errors[cat] = str(fut.exception())
+            else:
+                articles[cat] = fut.result()
+
+        if self.planner is not None:
+            self.planner.record(query, articles)
+
+        aggregated_headlines = {"headlines": merge_headlines(articles)}
+        if pending:
+            aggregated_headlines["pending"] = pending
+        if errors:
+            aggregated_headlines["errors"] = errors
+        return aggregated_headlines
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def _headlines_key(category: str, query: str) -> tuple:
+    return (
+        "top-headlines",
+        category,
+        _normalize_query(query),
+        NEWS_COUNTRY,
+        NEWS_LANGUAGE,
+    )
 
-            aggregated_headlines = []
-            for fut in concurrent.futures.wait(futures)[0]:
-                aggregated_headlines.append(fut.result())
 
-            return aggregated_headlines
\ No newline at end of file
+def _article(article: dict) -> dict:
+    return {"title": article["title"], "url": article.get("url")}
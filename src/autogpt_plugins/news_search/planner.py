@@ -0,0 +1,215 @@
+"""Plans the NewsAPI requests of a news search within the daily quota."""
+from __future__ import annotations
+
+import collections
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Words that tie a query to a NewsAPI top-headlines category.
+_KEYWORDS = {
+    "technology": (
+        "ai app apple chip chips computer crypto cyber gadget google gpt"
+        " internet iphone microsoft openai robot robotics smartphone software"
+        " startup tech technology"
+    ),
+    "business": (
+        "bank banks business company earnings economy finance inflation ipo"
+        " market markets merger price prices profit shares stock stocks trade"
+    ),
+    "entertainment": (
+        "actor actress album celebrity concert film films hollywood movie"
+        " movies music netflix oscars series show singer tv"
+    ),
+    "health": (
+        "cancer covid disease drug drugs fda health hospital medical medicine"
+        " pandemic vaccine virus"
+    ),
+    "sports": (
+        "baseball basketball cricket cup football golf league match nba nfl"
+        " olympics soccer sport sports tennis"
+    ),
+    "science": (
+        "astronomy biology climate nasa physics planet research science"
+        " scientists space species study"
+    ),
+}
+CATEGORY_KEYWORDS = {
+    category: set(words.split()) for category, words in _KEYWORDS.items()
+}
+WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Plan:
+    """The requests to make for one search: top headlines of `categories`,
+    or a single `get_everything` request when `everything` is set. An empty
+    plan means the quota is used up."""
+
+    categories: List[str] = field(default_factory=list)
+    everything: bool = False
+
+    @property
+    def requests(self) -> int:
+        return len(self.categories) + int(self.everything)
+
+
+class RequestPlanner:
+    """
+    Decides which NewsAPI requests a search makes, and counts the requests
+    made today against `daily_quota`.
+
+    A query is sent to the categories its words point to, at most
+    `max_categories` of them, and to a single `get_everything` request when
+    they point to none. Categories that returned nothing for a similar query
+    (sharing at least half of its words) within `history_ttl` seconds are
+    skipped. Once less than `low_quota` requests are left, a search makes a
+    single request, and none at all when the quota is used up.
+
+    Usage is kept in the JSON file at `path`, so it survives restarts. If
+    the file cannot be written, usage is only counted in memory.
+    """
+
+    def __init__(
+        self,
+        daily_quota: int = 100,
+        path: Optional[str] = None,
+        max_categories: int = 2,
+        low_quota: int = 10,
+        history_ttl: float = 6 * 3600,
+        history_size: int = 256,
+    ):
+        self.daily_quota = daily_quota
+        self.path = path
+        self.max_categories = max_categories
+        self.low_quota = low_quota
+        self.history_ttl = history_ttl
+        self._history = collections.deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._usage = self._load_usage()
+
+    @classmethod
+    def from_env(cls) -> "RequestPlanner":
+        return cls(
+            daily_quota=int(os.getenv("NEWSAPI_DAILY_QUOTA", "100")),
+            path=os.getenv("NEWSAPI_USAGE_PATH")
+            or os.path.join(
+                os.path.expanduser("~"),
+                ".cache",
+                "autogpt_plugins",
+                "newsapi_usage.json",
+            ),
+        )
+
+    @property
+    def remaining(self) -> int:
+        """Requests left in today's quota."""
+        with self._lock:
+            return self.daily_quota - self._requests_today()
+
+    def plan(self, query: str) -> Plan:
+        """Return the requests to make for `query`."""
+        remaining = self.remaining
+        if remaining <= 0:
+            return Plan()
+
+        words = _words(query)
+        hits, misses = self._recent_results(words)
+        categories = [
+            category
+            for category, keywords in CATEGORY_KEYWORDS.items()
+            if words & keywords or category in hits
+        ]
+        categories = [category for category in categories if category not in misses]
+        limit = 1 if remaining < self.low_quota else self.max_categories
+        categories = categories[: min(limit, remaining)]
+        if not categories:
+            return Plan(everything=True)
+        return Plan(categories=categories)
+
+    def count_requests(self, requests: int) -> None:
+        """Count `requests` API requests against today's quota."""
+        with self._lock:
+            # Pick up requests made by other processes sharing the file.
+            self._usage = self._load_usage() or self._usage
+            self._requests_today()
+            self._usage["requests"] += requests
+            self._save_usage()
+
+    def record(self, query: str, results: Dict[str, list]) -> None:
+        """Remember which categories had results for `query`.
+
+        Args:
+            query (str): The search query.
+            results (Dict[str, list]): The headlines of each category that
+                                       answered.
+        """
+        found = {
+            category: bool(headlines)
+            for category, headlines in results.items()
+            if category in CATEGORY_KEYWORDS
+        }
+        if found:
+            with self._lock:
+                self._history.append((_words(query), time.time(), found))
+
+    def _recent_results(self, words: set) -> tuple[set, set]:
+        """Return the categories that had results, and those that had none,
+        for recent queries similar to `words`."""
+        hits, misses = set(), set()
+        if not words:
+            return hits, misses
+        now = time.time()
+        with self._lock:
+            for past_words, recorded_at, found in self._history:
+                if now - recorded_at > self.history_ttl:
+                    continue
+                if len(words & past_words) * 2 < len(words | past_words):
+                    continue
+                for category, had_results in found.items():
+                    (hits if had_results else misses).add(category)
+        return hits, misses - hits
+
+    def _requests_today(self) -> int:
+        """Return today's usage, starting a new day if needed. Callers must
+        hold the lock."""
+        today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        if self._usage.get("date") != today:
+            self._usage = {"date": today, "requests": 0}
+        return self._usage["requests"]
+
+    def _load_usage(self) -> dict:
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _save_usage(self) -> None:
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._usage, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # Keep counting in memory only.
+            logger.warning("Could not write the NewsAPI usage %s: %s", self.path, e)
+
+
+def _words(query: str) -> set:
+    return set(WORD.findall(query.lower()))
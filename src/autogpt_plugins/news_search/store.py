@@ -0,0 +1,182 @@
+"""Local full-text store of the news articles fetched from NewsAPI."""
+from __future__ import annotations
+
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    source TEXT,
+    date TEXT,
+    body TEXT,
+    category TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, body, content='articles', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts (rowid, title, body)
+    VALUES (new.id, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts (articles_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+END;
+CREATE INDEX IF NOT EXISTS articles_fetched_at ON articles (fetched_at);
+"""
+# bm25 weights of the title and body columns.
+_BM25_WEIGHTS = (3.0, 1.0)
+# Candidates ranked by bm25 alone, per result, before recency is applied.
+_CANDIDATES_PER_RESULT = 5
+_WORD = re.compile(r"\w+")
+
+
+class NewsStore:
+    """
+    Keeps every article `NewsSearch` fetches in a SQLite FTS5 index, so that
+    follow-up questions can be answered without NewsAPI.
+
+    Matches are ranked by BM25, with titles weighted above descriptions, and
+    the score halves for every `half_life_days` of article age. Only the
+    `max_articles` most recently fetched articles are kept.
+    """
+
+    def __init__(
+        self, path: str, half_life_days: float = 3, max_articles: int = 10000
+    ):
+        self.path = path
+        self.half_life_days = half_life_days
+        self.max_articles = max_articles
+        self._lock = threading.Lock()
+        self._db = None
+
+    @classmethod
+    def from_env(cls) -> "NewsStore":
+        return cls(
+            path=os.getenv("NEWS_LOCAL_STORE_PATH")
+            or os.path.join(
+                os.path.expanduser("~"),
+                ".cache",
+                "autogpt_plugins",
+                "news_articles.sqlite3",
+            ),
+            half_life_days=float(os.getenv("NEWS_LOCAL_HALF_LIFE_DAYS", "3")),
+            max_articles=int(os.getenv("NEWS_LOCAL_STORE_SIZE", "10000")),
+        )
+
+    def add(self, articles: List[dict], category: Optional[str] = None) -> None:
+        """Store NewsAPI articles, as returned by the API. Articles already
+        stored are left as they are.
+        Args:
+            articles (List[dict]): The `articles` of a NewsAPI response.
+            category (Optional[str]): The top-headlines category they are from.
+        """
+        rows = [
+            (
+                article["url"],
+                article["title"],
+                (article.get("source") or {}).get("name"),
+                article.get("publishedAt"),
+                article.get("description"),
+                category,
+                time.time(),
+            )
+            for article in articles
+            if article.get("url") and article.get("title")
+        ]
+        if not rows:
+            return
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "INSERT OR IGNORE INTO articles "
+                "(url, title, source, date, body, category, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            db.execute(
+                "DELETE FROM articles WHERE id IN (SELECT id FROM articles "
+                "ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_articles,),
+            )
+            db.commit()
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """Return the stored articles that best match `query`.
+        Args:
+            query (str): The search query.
+            limit (int): The maximum number of articles.
+        Returns:
+            List[dict]: `{"title", "url", "source", "date", "body"}` records,
+                        best match first.
+        """
+        words = _WORD.findall(query.lower())
+        if not words or limit <= 0:
+            return []
+        match = " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT a.title, a.url, a.source, a.date, a.body, "
+                    "bm25(articles_fts, ?, ?) AS rank "
+                    "FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid "
+                    "WHERE articles_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (*_BM25_WEIGHTS, match, limit * _CANDIDATES_PER_RESULT),
+                )
+                .fetchall()
+            )
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        scored = []
+        for title, url, source, date, body, rank in rows:
+            # bm25() is lower for better matches.
+            score = -rank * 0.5 ** (_age_days(date, now) / self.half_life_days)
+            scored.append(
+                (
+                    score,
+                    {
+                        "title": title,
+                        "url": url,
+                        "source": source,
+                        "date": date,
+                        "body": body,
+                    },
+                )
+            )
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [record for _, record in scored[:limit]]
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the store on first use. Callers must hold the lock."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            if self.path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+
+def _age_days(date: Optional[str], now: datetime.datetime) -> float:
+    """Return the age of an ISO 8601 publication date in days, 0 if unknown."""
+    if not date:
+        return 0.0
+    try:
+        published = datetime.datetime.fromisoformat(date.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=datetime.timezone.utc)
+    return max((now - published).total_seconds() / 86400, 0.0)
@@ -1,7 +1,17 @@
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 import pytest
 import json
+import threading
+import time
+import datetime
+import sqlite3
+from newsapi.newsapi_exception import NewsAPIException
+from . import news_search
+from .cache import NewsCache
+from .dedupe import merge_headlines
 from .news_search import NewsSearch
+from .planner import RequestPlanner
+from .store import NewsStore
 
 class TestNewsSearch():
 
@@ -21,13 +31,237 @@ class TestNewsSearch():
         self.NewsSearch.news_api_client.get_top_headlines = Mock(side_effect = self.mock_response)
 
     def test_news_search(self):
-        # For AI, only technology should be populated. However, we can't rely on ordering, 
-        # so we'll assert one actual answer and 5 empty answers
+        # For AI, only technology should be populated
         actual_output_autogpt = self.NewsSearch.news_search("AI")
-        assert actual_output_autogpt.count(['AutoGPT']) == 1
-        assert actual_output_autogpt.count([]) == 5 
-        
-        #For Cricket, we should have sports/entertainment
+        assert actual_output_autogpt == {
+            "headlines": [
+                {"title": "AutoGPT", "urls": [], "categories": ["technology"]}
+            ]
+        }
+
+        # For Cricket, we should have sports/entertainment, merged into one story
         actual_output_cricket = self.NewsSearch.news_search("Cricket")
-        assert actual_output_cricket.count(['World Cup']) == 2
-        assert actual_output_cricket.count([]) == 4
\ No newline at end of file
+        assert actual_output_cricket["headlines"] == [
+            {
+                "title": "World Cup",
+                "urls": [],
+                "categories": ["entertainment", "sports"],
+            }
+        ]
+
+    def test_news_search_deadline(self):
+        # A slow category is listed as pending and a failing one as an error,
+        # the other categories are still returned
+        def slow_response(*args, **kwargs):
+            if kwargs['category'] == "science":
+                time.sleep(0.5)
+            if kwargs['category'] == "health":
+                raise ValueError("rateLimited")
+            return self.mock_response(*args, **kwargs)
+
+        self.NewsSearch.news_api_client.get_top_headlines = Mock(
+            side_effect=slow_response
+        )
+        with patch.object(news_search, "NEWSAPI_DEADLINE", 0.1):
+            actual_output = self.NewsSearch.news_search("AI")
+        assert [h["title"] for h in actual_output["headlines"]] == ['AutoGPT']
+        assert actual_output["pending"] == ["science"]
+        assert actual_output["errors"] == {"health": "rateLimited"}
+
+    def test_merge_near_duplicates(self):
+        merged = merge_headlines({
+            "business": [
+                {"title": "Apple shares jump after record iPhone sales - Reuters",
+                 "url": "a"},
+                {"title": "Fed raises rates again", "url": "b"},
+            ],
+            "technology": [
+                {"title": "Apple shares jump after record iPhone sales - CNBC",
+                 "url": "c"},
+                {"title": "Apple shares jumped after record iPhone sales, report says",
+                 "url": "d"},
+                {"title": "Apple shares fall after weak iPhone sales", "url": "e"},
+            ],
+        })
+        assert [(m["urls"], m["categories"]) for m in merged] == [
+            (["a", "c", "d"], ["business", "technology"]),
+            (["b"], ["business"]),
+            (["e"], ["technology"]),
+        ]
+
+    def test_close(self):
+        self.NewsSearch.close()
+        with pytest.raises(RuntimeError):
+            self.NewsSearch.news_search("AI")
+
+    def test_close_cancels_pending_work(self):
+        release = threading.Event()
+        running = [
+            self.NewsSearch._submit(release.wait, 5)
+            for _ in range(self.NewsSearch.executor._max_workers)
+        ]
+        queued = self.NewsSearch._submit(lambda: "late")
+        self.NewsSearch.close()
+        release.set()
+        assert queued.cancelled()
+        assert all(future.result() for future in running)
+
+    def test_news_search_with_planner(self):
+        # Queries go to the categories their words point to, or to a single
+        # everything request, and the requests are counted
+        planner = RequestPlanner(daily_quota=3)
+        self.NewsSearch.planner = planner
+        self.NewsSearch.news_api_client.get_everything = Mock(
+            return_value={"articles": [{"title": "Election"}]}
+        )
+        headlines = lambda query: [  # noqa: E731
+            (h["title"], h["categories"])
+            for h in self.NewsSearch.news_search(query)["headlines"]
+        ]
+        assert headlines("AI") == [("AutoGPT", ["technology"])]
+        assert headlines("Cricket") == [("World Cup", ["sports"])]
+        assert headlines("France election") == [("Election", ["everything"])]
+        assert planner.remaining == 0
+        assert "error" in self.NewsSearch.news_search("AI")
+        assert self.NewsSearch.news_api_client.get_top_headlines.call_count == 2
+
+    def test_planner_skips_empty_categories(self):
+        planner = RequestPlanner()
+        assert planner.plan("AI stocks").categories == ["technology", "business"]
+        planner.record("AI stocks", {"technology": ["AutoGPT"], "business": []})
+        assert planner.plan("AI stocks today").categories == ["technology"]
+
+    def test_planner_usage_unwritable(self, tmp_path):
+        # Usage that cannot be saved is counted in memory and does not fail
+        # the search
+        (tmp_path / "file").write_text("")
+        usage_path = str(tmp_path / "file" / "usage.json")
+        planner = RequestPlanner(daily_quota=10, path=usage_path)
+        self.NewsSearch.planner = planner
+        output = self.NewsSearch.news_search("AI")
+        assert "errors" not in output
+        assert output["headlines"][0]["title"] == "AutoGPT"
+        requests = self.NewsSearch.news_api_client.get_top_headlines.call_count
+        assert planner.remaining == 10 - requests
+
+    def test_news_search_cache(self, tmp_path):
+        # Repeated lookups are answered from the cache, also after a restart
+        self.NewsSearch.cache = NewsCache(str(tmp_path / "news.sqlite3"), ttl=60)
+        first = self.NewsSearch.news_search("AI")
+        assert self.NewsSearch.news_search("ai ") == first
+        assert self.NewsSearch.news_api_client.get_top_headlines.call_count == 6
+
+        self.NewsSearch.cache = NewsCache(str(tmp_path / "news.sqlite3"), ttl=60)
+        assert self.NewsSearch.news_search("AI") == first
+        assert self.NewsSearch.news_api_client.get_top_headlines.call_count == 6
+
+    def test_cache_write_failure(self, tmp_path):
+        # A cache that cannot be written still returns the fetched value, and
+        # later lookups of the same key do not hang
+        cache = NewsCache(str(tmp_path / "news.sqlite3"), ttl=60)
+        cache._connect = Mock(
+            side_effect=sqlite3.OperationalError("database is locked")
+        )
+        assert cache.get_or_fetch("key", lambda: ["a"]) == ["a"]
+        cache._memory.clear()
+        assert cache.get_or_fetch("key", lambda: ["b"]) == ["b"]
+        assert not cache._inflight
+
+    def test_warmup(self):
+        self.NewsSearch.cache = NewsCache(None, ttl=60)
+        assert self.NewsSearch.start_warmup(60)
+        for _ in range(50):
+            if self.NewsSearch.news_api_client.get_top_headlines.call_count == 6:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.NewsSearch.news_search("")
+        assert self.NewsSearch.news_api_client.get_top_headlines.call_count == 6
+        self.NewsSearch.close()
+
+    def test_news_everything(self):
+        # Pages are fetched until the limit is reached, repeated URLs are skipped
+        def everything(**kwargs):
+            start = (kwargs["page"] - 1) * kwargs["page_size"]
+            return {"status": "ok", "totalResults": 500, "articles": [
+                {"title": f"Story {i}", "url": f"https://news/{i // 2 * 2}",
+                 "source": {"name": "Wire"}, "publishedAt": "2023-05-01T00:00:00Z",
+                 "description": "Details"}
+                for i in range(start, start + kwargs["page_size"])
+            ]}
+
+        self.NewsSearch.news_api_client.get_everything = Mock(side_effect=everything)
+        output = json.loads(self.NewsSearch.news_everything(
+            "AI", from_date="2023-05-01", sources="reuters", limit=150,
+            output_format="compact",
+        ))
+        assert len(output) == 150
+        assert output[0] == {"title": "Story 0", "url": "https://news/0",
+                             "source": "Wire", "date": "2023-05-01T00:00:00Z",
+                             "body": "Details"}
+        calls = self.NewsSearch.news_api_client.get_everything.call_args_list
+        assert [call.kwargs["page"] for call in calls] == [1, 2, 3]
+        assert calls[0].kwargs["sources"] == "reuters"
+        assert calls[0].kwargs["from_param"] == "2023-05-01"
+
+    def test_news_everything_partial(self):
+        # Paging stops at the daily quota, and a failing later page keeps the
+        # articles of the earlier ones
+        def everything(**kwargs):
+            if kwargs["page"] > 2:
+                raise NewsAPIException({"code": "maximumResultsReached"})
+            start = (kwargs["page"] - 1) * kwargs["page_size"]
+            return {"status": "ok", "totalResults": 1000, "articles": [
+                {"title": f"Story {i}", "url": f"https://news/{i}"}
+                for i in range(start, start + kwargs["page_size"])
+            ]}
+
+        self.NewsSearch.news_api_client.get_everything = Mock(side_effect=everything)
+        output = json.loads(self.NewsSearch.news_everything("AI", limit=500))
+        assert len(output) == 200
+
+        planner = RequestPlanner(daily_quota=1)
+        self.NewsSearch.planner = planner
+        output = json.loads(self.NewsSearch.news_everything("AI", limit=500))
+        assert len(output) == 100
+        assert planner.remaining == 0
+        assert "quota" in self.NewsSearch.news_everything("AI", limit=500)
+        assert self.NewsSearch.news_api_client.get_everything.call_count == 4
+
+    def test_search_local_news(self):
+        # Fetched articles are searchable offline, recent ones ranked first
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.NewsSearch.store = NewsStore(":memory:")
+        self.NewsSearch.news_api_client.get_everything = Mock(return_value={
+            "status": "ok", "totalResults": 3, "articles": [
+                {"title": "Old chip shortage story", "url": "https://news/1",
+                 "publishedAt": "2020-01-01T00:00:00Z", "description": "Chips"},
+                {"title": "New chip shortage story", "url": "https://news/2",
+                 "publishedAt": now,
+                 "description": "Chips"},
+                {"title": "Football results", "url": "https://news/3",
+                 "description": "Scores"},
+            ]})
+        self.NewsSearch.planner = RequestPlanner()
+        self.NewsSearch.news_search("France election")
+
+        output = json.loads(
+            self.NewsSearch.search_local_news("chip shortage", output_format="json")
+        )
+        urls = [article["url"] for article in output]
+        assert urls == ["https://news/2", "https://news/1"]
+        assert self.NewsSearch.news_api_client.get_everything.call_count == 1
+
+    def test_store_unavailable(self, tmp_path):
+        # A store whose directory cannot be created does not fail the search
+        (tmp_path / "file").write_text("")
+        self.NewsSearch.store = NewsStore(str(tmp_path / "file" / "news.sqlite3"))
+        self.NewsSearch.news_api_client.get_top_headlines = Mock(return_value={
+            "status": "ok", "totalResults": 1,
+            "articles": [{"title": "AutoGPT", "url": "https://news/1"}]})
+        output = self.NewsSearch.news_search("AI")
+        assert "errors" not in output
+        assert output["headlines"][0]["title"] == "AutoGPT"
+        assert self.NewsSearch.search_local_news("AI").startswith(
+            "Error: the local news store could not be searched"
+        )
@@ -25,6 +25,7 @@ class AutoGPTSceneXPlugin(AutoGPTPluginTemplate):
     def post_prompt(self, prompt: PromptGenerator) -> PromptGenerator:
         from .scenex_plugin.scenex_plugin import (
             describe_image,
+            describe_images,
             is_api_key_set,
         )
 
@@ -37,6 +38,14 @@ class AutoGPTSceneXPlugin(AutoGPTPluginTemplate):
                 },
                 describe_image,
             )
+            prompt.add_command(
+                "Describe several images by URL",
+                "describe_images",
+                {
+                    "images": "<comma separated image URLs>",
+                },
+                describe_images,
+            )
         else:
             print(
                 Fore.RED
@@ -1,6 +1,33 @@
+import base64
+import hashlib
+import io
+import json
+import logging
 import os
+import sqlite3
+import threading
+import time
 import requests
-from typing import List, Union
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SCENEX_URL = "https://us-central1-causal-diffusion.cloudfunctions.net/describe"
+# (connect, read) timeouts in seconds. Describing a batch takes a while.
+SCENEX_TIMEOUT = (3.05, 120)
+# Number of images sent per request by `describe_images`.
+SCENEX_BATCH_SIZE = int(os.getenv("SCENEX_BATCH_SIZE", "10"))
+
+# Two perceptual hashes at most this many bits apart are the same image.
+PHASH_MAX_DISTANCE = 4
+
+_session = None
+_session_lock = threading.Lock()
+logger = logging.getLogger(__name__)
 
 
 def is_api_key_set() -> bool:
@@ -14,6 +41,221 @@ def get_api_key():
     return api_key
 
 
+def _get_session() -> requests.Session:
+    """Return the keep-alive session shared by all SceneX requests."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_maxsize=4))
+                _session = session
+    return _session
+
+
+class DescriptionCache:
+    """
+    A SQLite store of image descriptions.
+
+    Entries are keyed by the image (its URL, or the SHA-256 of its content
+    for data URIs) together with the algorithm, features and languages. They
+    expire after `ttl` seconds, and only the `max_entries` most recently used
+    are kept. With `perceptual` set, each entry also keeps a perceptual hash
+    of the image, so resized or recompressed copies of an image find its
+    description too.
+
+    The cache is best effort: if the store cannot be read or written, the
+    error is logged and the image is described by the API as usual.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        ttl: float,
+        max_entries: int = 1000,
+        perceptual: bool = False,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.perceptual = perceptual
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and bool(self.path)
+
+    def get(
+        self,
+        identity: str,
+        params: str,
+        perceptual_hash: Optional[Callable[[], Optional[int]]] = None,
+    ) -> Tuple[Optional[str], Optional[int]]:
+        """Return the cached description, or None, and the perceptual hash of
+        the image if it was computed. `perceptual_hash` is only called when
+        the cache is perceptual and there is no entry for the exact image."""
+        if not self.enabled:
+            return None, None
+        now = time.time()
+        phash = None
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT key, description FROM descriptions "
+                    "WHERE key = ? AND stored_at >= ?",
+                    (_cache_key(identity, params), now - self.ttl),
+                ).fetchone()
+            if row is None and self.perceptual and perceptual_hash is not None:
+                # Computing the hash may download the image; do it without
+                # holding the lock.
+                phash = perceptual_hash()
+                if phash is not None:
+                    with self._lock:
+                        row = self._find_similar(params, phash, now)
+            if row is None:
+                self.misses += 1
+                return None, phash
+            with self._lock:
+                db = self._connect()
+                db.execute(
+                    "UPDATE descriptions SET used_at = ? WHERE key = ?", (now, row[0])
+                )
+                db.commit()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Could not read the SceneX cache %s: %s", self.path, e)
+            return None, phash
+        self.hits += 1
+        return row[1], phash
+
+    def set(
+        self,
+        identity: str,
+        params: str,
+        description: str,
+        phash: Optional[int] = None,
+    ) -> None:
+        """Store the description of an image."""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO descriptions "
+                    "(key, params, phash, description, stored_at, used_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        _cache_key(identity, params),
+                        params,
+                        None if phash is None else f"{phash:016x}",
+                        description,
+                        now,
+                        now,
+                    ),
+                )
+                db.execute(
+                    "DELETE FROM descriptions WHERE stored_at < ? OR key IN "
+                    "(SELECT key FROM descriptions ORDER BY used_at DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (now - self.ttl, self.max_entries),
+                )
+                db.commit()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Could not write the SceneX cache %s: %s", self.path, e)
+
+    def _find_similar(self, params: str, phash: int, now: float):
+        """Callers must hold the lock."""
+        rows = self._connect().execute(
+            "SELECT key, description, phash FROM descriptions "
+            "WHERE params = ? AND phash IS NOT NULL AND stored_at >= ?",
+            (params, now - self.ttl),
+        )
+        for key, description, other in rows:
+            if bin(phash ^ int(other, 16)).count("1") <= PHASH_MAX_DISTANCE:
+                return key, description
+        return None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the store on first use. Callers must hold the lock."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions (key TEXT PRIMARY KEY, "
+                "params TEXT NOT NULL, phash TEXT, description TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS descriptions_used_at "
+                "ON descriptions (used_at)"
+            )
+        return self._db
+
+
+# Descriptions are cached for SCENEX_CACHE_TTL seconds. A TTL of 0 disables the
+# cache. SCENEX_CACHE_PHASH=true also matches resized or recompressed copies of
+# an image, which needs Pillow.
+_cache = DescriptionCache(
+    path=os.getenv("SCENEX_CACHE_PATH")
+    or os.path.join(
+        os.path.expanduser("~"), ".cache", "autogpt_plugins", "scenex.sqlite3"
+    ),
+    ttl=float(os.getenv("SCENEX_CACHE_TTL", "2592000")),
+    max_entries=int(os.getenv("SCENEX_CACHE_SIZE", "1000")),
+    perceptual=os.getenv("SCENEX_CACHE_PHASH", "false").lower() == "true",
+)
+
+
+def _cache_key(identity: str, params: str) -> str:
+    return f"{identity}\n{params}"
+
+
+def _cache_params(algorithm: str, features: List[str], languages: List[str]) -> str:
+    return json.dumps([algorithm, sorted(features), sorted(languages)])
+
+
+def _image_identity(image: str) -> Tuple[str, Optional[bytes]]:
+    """Return the cache identity of an image and its content when it is at
+    hand. Data URIs are identified by the SHA-256 of their content, anything
+    else by itself."""
+    if not (image.startswith("data:") and "," in image):
+        return image, None
+    try:
+        content = base64.b64decode(image.split(",", 1)[1])
+    except ValueError:
+        return image, None
+    return f"sha256:{hashlib.sha256(content).hexdigest()}", content
+
+
+def _perceptual_hash(image: str, content: Optional[bytes]) -> Optional[int]:
+    """Return the 64 bit difference hash of an image, downloading it if its
+    content is not at hand, or None if it cannot be computed."""
+    if Image is None:
+        return None
+    try:
+        if content is None:
+            response = _get_session().get(image, timeout=SCENEX_TIMEOUT)
+            response.raise_for_status()
+            content = response.content
+        with Image.open(io.BytesIO(content)) as img:
+            small = img.convert("L").resize((9, 8), Image.LANCZOS)
+        pixels = list(small.getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            bits = bits << 1 | (left > right)
+    return bits
+
+
 Algorithm = Union["Aqua", "Bolt", "Comet", "Dune", "Ember", "Flash"]
 
 
@@ -23,7 +265,14 @@ def describe_image(
     features: List[str] = [],
     languages: List[str] = [],
 ) -> str:
-    url = "https://us-central1-causal-diffusion.cloudfunctions.net/describe"
+    identity, content = _image_identity(image)
+    params = _cache_params(algorithm, features, languages)
+    description, phash = _cache.get(
+        identity, params, lambda: _perceptual_hash(image, content)
+    )
+    if description is not None:
+        return {"image": image, "description": description}
+
     headers = {
         "x-api-key": f"token {get_api_key()}",
         "content-type": "application/json",
@@ -40,8 +289,89 @@ def describe_image(
         ]
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = _get_session().post(
+        SCENEX_URL, headers=headers, json=payload, timeout=SCENEX_TIMEOUT
+    )
     result = response.json().get("result", [])
     img = result[0] if result else {}
+    description = img.get("text", "")
+    if description:
+        _cache.set(identity, params, description, phash)
+
+    return {"image": image, "description": description}
+
+
+def describe_images(
+    images: Union[str, List[str]],
+    algorithm: Algorithm = "Dune",
+    features: List[str] = [],
+    languages: List[str] = [],
+    batch_size: int = None,
+) -> List[Dict[str, str]]:
+    """
+    Describe several images, sending up to `batch_size` of them per request
+    over a shared keep-alive session.
+
+    Args:
+        images: Image URLs, as a list or a comma or newline separated string.
+        batch_size: Images per request, defaults to `SCENEX_BATCH_SIZE`.
+
+    Returns:
+        A `{"image": ..., "description": ...}` dictionary per image, in the
+        order given. Images whose batch failed get an `"error"` instead.
+    """
+    if isinstance(images, str):
+        images = images.replace("\n", ",").split(",")
+    images = [image.strip() for image in images if image.strip()]
+    batch_size = max(int(batch_size or SCENEX_BATCH_SIZE), 1)
+    headers = {
+        "x-api-key": f"token {get_api_key()}",
+        "content-type": "application/json",
+    }
+    params = _cache_params(algorithm, features, languages)
+
+    # Each distinct image is described once, and only if it is not cached.
+    descriptions = {}
+    missing = []
+    for image in dict.fromkeys(images):
+        identity, content = _image_identity(image)
+        description, phash = _cache.get(
+            identity, params, lambda: _perceptual_hash(image, content)
+        )
+        if description is None:
+            missing.append((image, identity, phash))
+        else:
+            descriptions[image] = {"image": image, "description": description}
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start : start + batch_size]
+        payload = {
+            "data": [
+                {
+                    "image": image,
+                    "algorithm": algorithm,
+                    "features": features,
+                    "languages": languages,
+                }
+                for image, _, _ in batch
+            ]
+        }
+        try:
+            response = _get_session().post(
+                SCENEX_URL, headers=headers, json=payload, timeout=SCENEX_TIMEOUT
+            )
+            response.raise_for_status()
+            result = response.json().get("result", [])
+        except (requests.RequestException, ValueError) as e:
+            for image, _, _ in batch:
+                descriptions[image] = {"image": image, "error": str(e)}
+            continue
+
+        # Results come back in the order of `data`.
+        for i, (image, identity, phash) in enumerate(batch):
+            description = result[i].get("text", "") if i < len(result) else ""
+            if description:
+                _cache.set(identity, params, description, phash)
+            descriptions[image] = {"image": image, "description": description}
 
-    return {"image": image, "description": img.get("text", "")}
+    return [descriptions[image] for image in images]
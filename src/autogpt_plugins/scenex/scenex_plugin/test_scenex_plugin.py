@@ -1,8 +1,17 @@
+import base64
 import os
+import tempfile
 from unittest.mock import MagicMock, patch
 import unittest
 
-from scenex_plugin import describe_image, is_api_key_set, get_api_key
+from scenex_plugin import (
+    SCENEX_TIMEOUT,
+    DescriptionCache,
+    describe_image,
+    describe_images,
+    is_api_key_set,
+    get_api_key,
+)
 
 MOCK_API_KEY = "secret"
 MOCK_IMAGE = "https://example.com/image.png"
@@ -10,6 +19,13 @@ MOCK_DESCRIPTION = "example description"
 
 
 class TestEmailPlugin(unittest.TestCase):
+    def setUp(self):
+        # Use a fresh cache instead of the one in the user's home directory
+        cache = DescriptionCache(":memory:", ttl=60)
+        cache_patch = patch("scenex_plugin._cache", cache)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
     @patch.dict(
         os.environ,
         {
@@ -30,8 +46,9 @@ class TestEmailPlugin(unittest.TestCase):
             "SCENEX_API_KEY": MOCK_API_KEY,
         },
     )
-    @patch("scenex_plugin.requests.post")
-    def test_describe_image(self, mock_post):
+    @patch("scenex_plugin._get_session")
+    def test_describe_image(self, mock_get_session):
+        mock_post = mock_get_session.return_value.post
         mock_post.return_value = MagicMock(
             json=MagicMock(
                 return_value={
@@ -78,7 +95,140 @@ class TestEmailPlugin(unittest.TestCase):
                     }
                 ]
             },
+            timeout=SCENEX_TIMEOUT,
+        )
+
+    @patch.dict(
+        os.environ,
+        {
+            "SCENEX_API_KEY": MOCK_API_KEY,
+        },
+    )
+    @patch("scenex_plugin._get_session")
+    def test_describe_images(self, mock_get_session):
+        def post(url, headers, json, timeout):
+            return MagicMock(
+                json=MagicMock(
+                    return_value={
+                        "result": [
+                            {"image": item["image"], "text": f"about {item['image']}"}
+                            for item in json["data"]
+                        ]
+                    }
+                )
+            )
+
+        mock_post = mock_get_session.return_value.post
+        mock_post.side_effect = post
+        images = [f"https://example.com/{i}.png" for i in range(5)]
+
+        result = describe_images(images + [images[0]], batch_size=2)
+
+        # Results map back to their inputs, duplicates are described once
+        self.assertEqual(
+            result,
+            [{"image": image, "description": f"about {image}"} for image in images]
+            + [{"image": images[0], "description": f"about {images[0]}"}],
         )
+        self.assertEqual(
+            [len(call.kwargs["json"]["data"]) for call in mock_post.call_args_list],
+            [2, 2, 1],
+        )
+
+    @patch.dict(
+        os.environ,
+        {
+            "SCENEX_API_KEY": MOCK_API_KEY,
+        },
+    )
+    @patch("scenex_plugin._get_session")
+    def test_describe_image_cached(self, mock_get_session):
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value = MagicMock(
+            json=MagicMock(return_value={"result": [{"text": MOCK_DESCRIPTION}]})
+        )
+        encoded = base64.b64encode(b"same image bytes").decode()
+        data_uris = [
+            f"data:image/png;base64,{encoded}",
+            f"data:image/jpeg;base64,{encoded}",
+        ]
+
+        # Data URIs with the same content share one description
+        for image in data_uris + [MOCK_IMAGE, MOCK_IMAGE]:
+            result = describe_image(image=image)
+            self.assertEqual(result["description"], MOCK_DESCRIPTION)
+
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch.dict(
+        os.environ,
+        {
+            "SCENEX_API_KEY": MOCK_API_KEY,
+        },
+    )
+    @patch("scenex_plugin._get_session")
+    def test_describe_image_does_not_read_local_files(self, mock_get_session):
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value = MagicMock(
+            json=MagicMock(return_value={"result": [{"text": MOCK_DESCRIPTION}]})
+        )
+
+        with tempfile.NamedTemporaryFile(suffix=".env") as f:
+            f.write(b"SECRET=1")
+            f.flush()
+            describe_image(image=f.name)
+
+        sent = mock_post.call_args.kwargs["json"]["data"][0]["image"]
+        self.assertEqual(sent, f.name)
+
+    @patch.dict(
+        os.environ,
+        {
+            "SCENEX_API_KEY": MOCK_API_KEY,
+        },
+    )
+    @patch("scenex_plugin._perceptual_hash", return_value=0x0F)
+    @patch("scenex_plugin._get_session")
+    def test_describe_image_perceptual_cache(self, mock_get_session, mock_phash):
+        cache = DescriptionCache(":memory:", ttl=60, perceptual=True)
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value = MagicMock(
+            json=MagicMock(return_value={"result": [{"text": MOCK_DESCRIPTION}]})
+        )
+
+        with patch("scenex_plugin._cache", cache):
+            describe_image(image=MOCK_IMAGE)
+            # A cached URL is found without computing its hash again
+            describe_image(image=MOCK_IMAGE)
+            self.assertEqual(mock_phash.call_count, 1)
+
+            # A copy at another URL with a close hash reuses the description
+            mock_phash.return_value = 0x0E
+            result = describe_image(image="https://example.com/copy.jpg")
+
+        self.assertEqual(result["description"], MOCK_DESCRIPTION)
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch.dict(
+        os.environ,
+        {
+            "SCENEX_API_KEY": MOCK_API_KEY,
+        },
+    )
+    @patch("scenex_plugin._get_session")
+    def test_describe_image_cache_unavailable(self, mock_get_session):
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value = MagicMock(
+            json=MagicMock(return_value={"result": [{"text": MOCK_DESCRIPTION}]})
+        )
+
+        with tempfile.NamedTemporaryFile() as f:
+            # The cache path is a file, so its directory cannot be created
+            cache = DescriptionCache(os.path.join(f.name, "scenex.sqlite3"), ttl=60)
+            with patch("scenex_plugin._cache", cache):
+                result = describe_image(image=MOCK_IMAGE)
+
+        self.assertEqual(result["description"], MOCK_DESCRIPTION)
 
 
 if __name__ == "__main__":
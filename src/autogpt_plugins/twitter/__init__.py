@@ -2,7 +2,9 @@
 from typing import Any, Dict, List, Optional, Tuple, TypedDict, TypeVar
 from auto_gpt_plugin_template import AutoGPTPluginTemplate
 import os
+import threading
 import tweepy
+from .tweet_buffer import TweetBufferStream, TweetRingBuffer
 
 PromptGenerator = TypeVar("PromptGenerator")
 
@@ -29,6 +31,21 @@ class AutoGPTTwitter(AutoGPTPluginTemplate):
         self.tweet_id = []
         self.tweets = []
 
+        # Optional background stream of tweets matching keywords and/or
+        # mentions of the authenticated user.
+        self.stream_keywords = [
+            keyword.strip()
+            for keyword in os.getenv("TW_STREAM_KEYWORDS", "").split(",")
+            if keyword.strip()
+        ]
+        self.stream_mentions = os.getenv("TW_STREAM_MENTIONS", "False") == "True"
+        self.tweet_buffer = TweetRingBuffer(
+            max_size=int(os.getenv("TW_STREAM_BUFFER_SIZE", "1000")),
+            spill_path=os.getenv("TW_STREAM_SPILL_PATH") or None,
+        )
+        self.stream = None
+        self.stream_thread = None
+
         self.api = None
 
         if (
@@ -45,15 +62,46 @@ class AutoGPTTwitter(AutoGPTPluginTemplate):
                 self.twitter_access_token_secret,
             )
             self.api = tweepy.API(self.auth)
-            self.stream = tweepy.Stream(
+            self.stream = TweetBufferStream(
                 self.twitter_consumer_key,
                 self.twitter_consumer_secret,
                 self.twitter_access_token,
                 self.twitter_access_token_secret,
+                buffer=self.tweet_buffer,
+                daemon=True,
             )
+            self.start_stream()
         else:
             print("Twitter credentials not found in .env file.")
 
+    def start_stream(self) -> bool:
+        """Starts the background stream consumer if it is configured and not
+        already running. Called once when the plugin is created.
+        Returns:
+            bool: True if the stream is running."""
+        if self.stream is None:
+            return False
+        if self.stream_thread is not None:
+            return True
+        if not (self.stream_keywords or self.stream_mentions):
+            return False
+
+        self.stream_thread = threading.Thread(target=self._run_stream, daemon=True)
+        self.stream_thread.start()
+        return True
+
+    def _run_stream(self) -> None:
+        """Consumes the filtered stream. Looking up the screen name to track
+        mentions of happens here too, so it never blocks the agent."""
+        track = list(self.stream_keywords)
+        if self.stream_mentions:
+            try:
+                track.append(f"@{self.api.verify_credentials().screen_name}")
+            except tweepy.TweepyException as e:
+                print(f"Could not stream mentions of the authenticated user: {e}")
+        if track:
+            self.stream.filter(track=track)
+
     def can_handle_on_response(self) -> bool:
         """This method is called to check that the plugin can
         handle the on_response method.
@@ -236,18 +284,27 @@ class AutoGPTTwitter(AutoGPTPluginTemplate):
         if self.api:
             from .twitter import (
                 get_mentions,
+                get_stream_tweets,
                 post_reply,
                 post_tweet,
                 search_twitter_user,
+                search_twitter_users,
             )
 
             prompt.add_command(
-                "post_tweet", "Post Tweet", {"tweet_text": "<tweet_text>"}, post_tweet
+                "post_tweet",
+                "Post Tweet",
+                {"tweet_text": "<tweet_text>", "media_path": "<optional_media_path>"},
+                post_tweet,
             )
             prompt.add_command(
                 "post_reply",
                 "Post Twitter Reply",
-                {"tweet_text": "<tweet_text>", "tweet_id": "<tweet_id>"},
+                {
+                    "tweet_text": "<tweet_text>",
+                    "tweet_id": "<tweet_id>",
+                    "media_path": "<optional_media_path>",
+                },
                 post_reply,
             )
             prompt.add_command("get_mentions", "Get Twitter Mentions", {}, get_mentions)
@@ -260,5 +317,21 @@ class AutoGPTTwitter(AutoGPTPluginTemplate):
                 },
                 search_twitter_user,
             )
+            prompt.add_command(
+                "search_twitter_users",
+                "Search Multiple Twitter Users",
+                {
+                    "target_users": "<comma_separated_target_users>",
+                    "number_of_tweets": "<number_of_tweets>",
+                },
+                search_twitter_users,
+            )
+            if self.stream_thread is not None:
+                prompt.add_command(
+                    "get_stream_tweets",
+                    "Get Streamed Tweets",
+                    {"max_tweets": "<max_tweets>"},
+                    get_stream_tweets,
+                )
 
         return prompt
@@ -0,0 +1,130 @@
+"""Chunked, resumable media uploads using the INIT/APPEND/FINALIZE flow."""
+from __future__ import annotations
+import json
+import mimetypes
+import mmap
+import os
+import time
+from typing import Any, Dict, Optional
+import tweepy
+
+# Twitter accepts at most 1000 segments of at most 5 MiB each.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_SEGMENTS = 1000
+
+STATE_SUFFIX = ".upload.json"
+
+
+def chunked_media_upload(
+    api: tweepy.API, media_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Any:
+    """Uploads a file in fixed-size chunks and returns the finalized media.
+
+    The file is memory mapped and sent one chunk at a time, so memory use does
+    not depend on the file size. Progress is recorded in a state file next to
+    the media; if an upload is interrupted, the next call for the same,
+    unchanged file resumes after the last uploaded chunk.
+
+    Only images and videos are accepted, going by the file extension.
+
+    Args:
+        api (tweepy.API): The tweepy API object.
+        media_path (str): The path of the file to upload.
+        chunk_size (int): The preferred size of each chunk in bytes.
+
+    Returns:
+        tweepy.models.Media: The uploaded media.
+    """
+
+    media_type = mimetypes.guess_type(media_path)[0] or "application/octet-stream"
+    if not media_type.startswith(("image/", "video/")):
+        raise ValueError(
+            f"Only images and videos can be attached, not {media_type}: {media_path}"
+        )
+    file_size = os.path.getsize(media_path)
+    if not file_size:
+        raise ValueError(f"Cannot upload empty file: {media_path}")
+
+    min_chunk_size = -(-file_size // MAX_SEGMENTS)
+    chunk_size = max(min(chunk_size, MAX_CHUNK_SIZE), min_chunk_size)
+    segments = -(-file_size // chunk_size)
+
+    state_path = media_path + STATE_SUFFIX
+    state = _load_state(state_path, media_path, chunk_size)
+    if state is None:
+        media = api.chunked_upload_init(
+            file_size, media_type, media_category=_media_category(media_type)
+        )
+        state = {
+            "media_id": media.media_id,
+            "size": file_size,
+            "mtime": os.path.getmtime(media_path),
+            "chunk_size": chunk_size,
+            "next_segment": 0,
+            "expires_at": time.time() + getattr(media, "expires_after_secs", 86400),
+        }
+        _save_state(state_path, state)
+
+    filename = os.path.basename(media_path)
+    with open(media_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        for segment_index in range(state["next_segment"], segments):
+            start = segment_index * chunk_size
+            api.chunked_upload_append(
+                state["media_id"],
+                (filename, mm[start : start + chunk_size]),
+                segment_index,
+            )
+            state["next_segment"] = segment_index + 1
+            _save_state(state_path, state)
+
+    media = api.chunked_upload_finalize(state["media_id"])
+    os.remove(state_path)
+
+    processing_info = getattr(media, "processing_info", None)
+    while processing_info and processing_info["state"] in ("pending", "in_progress"):
+        time.sleep(processing_info.get("check_after_secs", 1))
+        media = api.get_media_upload_status(media.media_id)
+        processing_info = getattr(media, "processing_info", None)
+
+    if processing_info and processing_info["state"] == "failed":
+        raise tweepy.TweepyException(
+            f"Media processing failed: {processing_info.get('error')}"
+        )
+
+    return media
+
+
+def _media_category(media_type: str) -> str:
+    if media_type == "image/gif":
+        return "tweet_gif"
+    if media_type.startswith("video/"):
+        return "tweet_video"
+    return "tweet_image"
+
+
+def _load_state(
+    state_path: str, media_path: str, chunk_size: int
+) -> Optional[Dict[str, Any]]:
+    """Returns the saved upload state if it can still be resumed."""
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if (
+        state.get("size") == os.path.getsize(media_path)
+        and state.get("mtime") == os.path.getmtime(media_path)
+        and state.get("chunk_size") == chunk_size
+        and state.get("expires_at", 0) > time.time()
+    ):
+        return state
+    return None
+
+
+def _save_state(state_path: str, state: Dict[str, Any]) -> None:
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
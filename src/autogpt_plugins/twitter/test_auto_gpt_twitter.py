@@ -0,0 +1,253 @@
+import datetime
+import json
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+import tweepy
+
+from . import twitter
+from .media_upload import STATE_SUFFIX, chunked_media_upload
+from .tweet_buffer import TweetRingBuffer
+from .twitter import search_twitter_users
+
+CREDENTIALS = {
+    "TW_CONSUMER_KEY": "key",
+    "TW_CONSUMER_SECRET": "secret",
+    "TW_ACCESS_TOKEN": "token",
+    "TW_ACCESS_TOKEN_SECRET": "token secret",
+}
+
+
+def new_plugin(**environ):
+    """Create a plugin instance, bypassing the singleton."""
+    plugin = object.__new__(twitter.AutoGPTTwitter)
+    with patch.dict("os.environ", {**CREDENTIALS, **environ}):
+        plugin.__init__()
+    return plugin
+
+
+def rate_limited():
+    response = MagicMock(status_code=429, reason="Too Many Requests")
+    response.json.return_value = {}
+    return tweepy.TooManyRequests(response)
+
+
+class TestSearchTwitterUsers(unittest.TestCase):
+    def test_rate_limited_user_keeps_partial_results(self):
+        def timeline(user, number_of_tweets):
+            yield [datetime.datetime(2023, 1, 2), user, 2, f"first of {user}"]
+            if user == "limited":
+                raise rate_limited()
+            yield [datetime.datetime(2023, 1, 1), user, 1, f"second of {user}"]
+
+        with patch.object(twitter, "_iter_user_timeline", side_effect=timeline):
+            result = search_twitter_users("ok, @limited", 2)
+
+        self.assertIn("second of ok", result)
+        self.assertIn("first of limited", result)
+        self.assertTrue(
+            result.endswith("Rate limited, tweets may be missing for: @limited")
+        )
+
+    def test_api_does_not_wait_on_rate_limit(self):
+        # Waiting would block every command for up to 15 minutes.
+        self.assertFalse(new_plugin().api.wait_on_rate_limit)
+
+
+class TestTweetStream(unittest.TestCase):
+    def test_stream_started_once_when_configured(self):
+        with patch.object(twitter.AutoGPTTwitter, "_run_stream") as run_stream:
+            plugin = new_plugin(TW_STREAM_KEYWORDS="a, b")
+            self.assertTrue(plugin.start_stream())
+            plugin.stream_thread.join()
+            self.assertIsNone(new_plugin().stream_thread)
+        run_stream.assert_called_once_with()
+
+    def test_mentions_resolved_on_stream_thread(self):
+        plugin = new_plugin()
+        plugin.stream_keywords = ["a"]
+        plugin.stream_mentions = True
+        plugin.api = MagicMock()
+        plugin.api.verify_credentials.return_value.screen_name = "me"
+        plugin.stream = MagicMock()
+        plugin._run_stream()
+        plugin.stream.filter.assert_called_once_with(track=["a", "@me"])
+
+
+class TestTweetRingBuffer(unittest.TestCase):
+    def test_rejects_empty_buffer(self):
+        with self.assertRaises(ValueError):
+            TweetRingBuffer(max_size=0)
+
+    def test_drain_spill_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spill_path = os.path.join(directory, "spill.jsonl")
+            buffer = TweetRingBuffer(max_size=2, spill_path=spill_path)
+            for i in range(5):
+                buffer.append({"ID": i})
+
+            self.assertEqual(buffer.drain(2), [{"ID": 0}, {"ID": 1}])
+            buffer.append({"ID": 5})
+            self.assertEqual(buffer.drain(), [{"ID": i} for i in range(2, 6)])
+            # The fully read spill file is emptied.
+            self.assertEqual(os.path.getsize(spill_path), 0)
+            self.assertEqual(len(buffer), 0)
+
+            for i in range(6, 9):
+                buffer.append({"ID": i})
+            self.assertEqual(buffer.drain(), [{"ID": i} for i in range(6, 9)])
+
+
+class TestChunkedMediaUpload(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_path = os.path.join(directory.name, "clip.mp4")
+        self.state_path = self.media_path + STATE_SUFFIX
+        with open(self.media_path, "wb") as f:
+            f.write(b"abcdefghij")
+
+        self.api = MagicMock()
+        self.api.chunked_upload_init.return_value = MagicMock(
+            media_id=1, expires_after_secs=3600
+        )
+        self.api.chunked_upload_finalize.return_value = MagicMock(
+            media_id=1, processing_info=None
+        )
+        self.appended = []
+
+    def append(self, media_id, chunk, segment_index):
+        self.appended.append((media_id, chunk[1], segment_index))
+
+    def fail_at(self, failing_index):
+        def append(media_id, chunk, segment_index):
+            if segment_index == failing_index:
+                raise tweepy.TweepyException("connection reset")
+            self.append(media_id, chunk, segment_index)
+
+        return append
+
+    def test_upload_in_chunks(self):
+        self.api.chunked_upload_append.side_effect = self.append
+        media = chunked_media_upload(self.api, self.media_path, chunk_size=4)
+
+        self.assertEqual(media.media_id, 1)
+        self.api.chunked_upload_init.assert_called_once_with(
+            10, "video/mp4", media_category="tweet_video"
+        )
+        self.assertEqual(
+            self.appended, [(1, b"abcd", 0), (1, b"efgh", 1), (1, b"ij", 2)]
+        )
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_resume_after_failure(self):
+        self.api.chunked_upload_append.side_effect = self.fail_at(1)
+        with self.assertRaises(tweepy.TweepyException):
+            chunked_media_upload(self.api, self.media_path, chunk_size=4)
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["next_segment"], 1)
+
+        self.api.chunked_upload_append.side_effect = self.append
+        chunked_media_upload(self.api, self.media_path, chunk_size=4)
+
+        self.api.chunked_upload_init.assert_called_once()
+        self.assertEqual(
+            self.appended, [(1, b"abcd", 0), (1, b"efgh", 1), (1, b"ij", 2)]
+        )
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_changed_file_restarts_upload(self):
+        self.api.chunked_upload_append.side_effect = self.fail_at(1)
+        with self.assertRaises(tweepy.TweepyException):
+            chunked_media_upload(self.api, self.media_path, chunk_size=4)
+
+        with open(self.media_path, "wb") as f:
+            f.write(b"0123456789AB")
+        self.api.chunked_upload_init.return_value = MagicMock(
+            media_id=2, expires_after_secs=3600
+        )
+        self.appended.clear()
+        self.api.chunked_upload_append.side_effect = self.append
+        chunked_media_upload(self.api, self.media_path, chunk_size=4)
+
+        self.assertEqual(self.api.chunked_upload_init.call_count, 2)
+        self.assertEqual(
+            self.appended, [(2, b"0123", 0), (2, b"4567", 1), (2, b"89AB", 2)]
+        )
+
+    def test_stale_state_is_ignored(self):
+        for state in (
+            # Expired on Twitter's side
+            {"expires_at": 0},
+            # Written for a different chunk size
+            {"chunk_size": 8},
+        ):
+            with self.subTest(state=state):
+                self.appended.clear()
+                self.api.chunked_upload_init.reset_mock()
+                with open(self.state_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "media_id": 9,
+                            "size": 10,
+                            "mtime": os.path.getmtime(self.media_path),
+                            "chunk_size": 4,
+                            "next_segment": 2,
+                            "expires_at": 2**40,
+                            **state,
+                        },
+                        f,
+                    )
+                self.api.chunked_upload_append.side_effect = self.append
+                chunked_media_upload(self.api, self.media_path, chunk_size=4)
+
+                self.api.chunked_upload_init.assert_called_once()
+                self.assertEqual([index for _, _, index in self.appended], [0, 1, 2])
+
+    def test_rejects_empty_file(self):
+        open(self.media_path, "wb").close()
+        with self.assertRaises(ValueError):
+            chunked_media_upload(self.api, self.media_path)
+        self.api.chunked_upload_init.assert_not_called()
+
+    def test_rejects_files_that_are_not_media(self):
+        env_path = os.path.join(os.path.dirname(self.media_path), ".env")
+        with open(env_path, "w") as f:
+            f.write("TW_CONSUMER_SECRET=secret")
+        with self.assertRaisesRegex(ValueError, "Only images and videos"):
+            chunked_media_upload(self.api, env_path)
+        self.api.chunked_upload_init.assert_not_called()
+
+    def test_media_path_resolved_in_workspace(self):
+        workspace = os.path.realpath(os.path.dirname(self.media_path))
+
+        def path_in_workspace(relative_path):
+            path = os.path.realpath(os.path.join(workspace, relative_path))
+            if os.path.commonpath([path, workspace]) != workspace:
+                raise ValueError(f"Attempted to access outside of workspace: {path}")
+            return path
+
+        modules = {
+            "autogpt": types.ModuleType("autogpt"),
+            "autogpt.workspace": types.ModuleType("autogpt.workspace"),
+        }
+        modules["autogpt.workspace"].path_in_workspace = path_in_workspace
+        upload = MagicMock(return_value=MagicMock(media_id=7))
+        with patch.dict(sys.modules, modules), patch.object(
+            twitter, "chunked_media_upload", upload
+        ):
+            self.assertEqual(twitter._upload_media("clip.mp4"), [7])
+            with self.assertRaises(ValueError):
+                twitter._upload_media("../../.env")
+
+        upload.assert_called_once_with(
+            twitter.plugin.api, os.path.join(workspace, "clip.mp4")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
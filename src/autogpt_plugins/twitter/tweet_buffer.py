@@ -0,0 +1,102 @@
+"""Bounded buffer and background stream consumer for incoming tweets."""
+from __future__ import annotations
+import collections
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+import tweepy
+
+
+class TweetRingBuffer:
+    """
+    Fixed-size, thread-safe buffer of compact tweet records.
+
+    When the buffer is full the oldest record is dropped, or appended to
+    `spill_path` as a JSON line if a spill file is configured, so memory use
+    never grows beyond `max_size` records. Drained spill lines are skipped
+    with a read offset, and the file is truncated once all of it was read.
+    """
+
+    def __init__(self, max_size: int = 1000, spill_path: Optional[str] = None):
+        if max_size < 1:
+            raise ValueError(f"Tweet buffer size must be at least 1, got {max_size}")
+        self.max_size = max_size
+        self.spill_path = spill_path
+        self._spill_offset = 0
+        self._tweets = collections.deque()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tweets)
+
+    def append(self, tweet: Dict[str, Any]) -> None:
+        """Adds a tweet record, evicting the oldest one if the buffer is full.
+        Args:
+            tweet (Dict[str, Any]): The tweet record.
+        """
+        with self._lock:
+            if len(self._tweets) >= self.max_size:
+                evicted = self._tweets.popleft()
+                if self.spill_path:
+                    with open(self.spill_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(evicted, ensure_ascii=False) + "\n")
+            self._tweets.append(tweet)
+
+    def drain(self, max_items: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Removes and returns buffered tweets, oldest first. Spilled tweets
+        are older than the ones in memory, so they are returned first.
+        Args:
+            max_items (Optional[int]): The maximum number of tweets to return.
+        Returns:
+            List[Dict[str, Any]]: The drained tweet records.
+        """
+        with self._lock:
+            drained = self._drain_spill(max_items)
+            while self._tweets and (max_items is None or len(drained) < max_items):
+                drained.append(self._tweets.popleft())
+            return drained
+
+    def _drain_spill(self, max_items: Optional[int]) -> List[Dict[str, Any]]:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+
+        drained = []
+        with open(self.spill_path, "rb+") as f:
+            f.seek(self._spill_offset)
+            while max_items is None or len(drained) < max_items:
+                line = f.readline()
+                if not line:
+                    break
+                drained.append(json.loads(line))
+            self._spill_offset = f.tell()
+            if not f.read(1):
+                # Everything was read, start the file over.
+                f.truncate(0)
+                self._spill_offset = 0
+        return drained
+
+
+class TweetBufferStream(tweepy.Stream):
+    """
+    Filtered stream that writes every received status into a TweetRingBuffer.
+    """
+
+    def __init__(self, *args, buffer: TweetRingBuffer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer = buffer
+
+    def on_status(self, status):
+        """Stores a compact record of the received status.
+        Args:
+            status (tweepy.models.Status): The status received.
+        """
+        extended_tweet = getattr(status, "extended_tweet", {})
+        self.buffer.append(
+            {
+                "Time": status.created_at.isoformat(),
+                "User": status.user.screen_name,
+                "ID": status.id,
+                "Tweet": extended_tweet.get("full_text", status.text),
+            }
+        )
@@ -1,33 +1,49 @@
 """This module contains functions for interacting with the Twitter API."""
 from __future__ import annotations
+import concurrent.futures
+from typing import Iterator, List, Optional, Tuple, Union
 from . import AutoGPTTwitter
+from .media_upload import chunked_media_upload
 import pandas as pd
 import tweepy
 
 plugin = AutoGPTTwitter()
 
+# Upper bound on the number of timelines fetched at the same time. The
+# user_timeline endpoint allows 900 requests per 15 minutes per user, so a
+# small pool keeps bursts well inside the limit.
+MAX_TIMELINE_WORKERS = 8
 
-def post_tweet(tweet_text: str) -> str:
+TIMELINE_COLUMNS = ["Time", "User", "ID", "Tweet"]
+
+
+def post_tweet(tweet_text: str, media_path: Optional[str] = None) -> str:
     """Posts a tweet to twitter.
 
     Args:
         tweet (str): The tweet to post.
+        media_path (str, optional): The path of an image or video to attach.
 
     Returns:
         str: The tweet that was posted.
     """
 
-    _tweetID = plugin.api.update_status(status=tweet_text)
+    _tweetID = plugin.api.update_status(
+        status=tweet_text, media_ids=_upload_media(media_path)
+    )
 
     return f"Success! Tweet: {_tweetID.text}"
 
 
-def post_reply(tweet_text: str, tweet_id: int) -> str:
+def post_reply(
+    tweet_text: str, tweet_id: int, media_path: Optional[str] = None
+) -> str:
     """Posts a reply to a tweet.
 
     Args:
         tweet (str): The tweet to post.
         tweet_id (int): The ID of the tweet to reply to.
+        media_path (str, optional): The path of an image or video to attach.
 
     Returns:
         str: The tweet that was posted.
@@ -35,12 +51,33 @@ def post_reply(tweet_text: str, tweet_id: int) -> str:
 
     replyID = plugin.api.update_status(
         status=tweet_text, in_reply_to_status_id=tweet_id,
-        auto_populate_reply_metadata=True
+        auto_populate_reply_metadata=True, media_ids=_upload_media(media_path)
     )
 
     return f"Success! Tweet: {replyID.text}"
 
 
+def _upload_media(media_path: Optional[str]) -> Optional[List[int]]:
+    """Uploads the media to attach to a tweet, if any.
+
+    Args:
+        media_path (str, optional): The path of an image or video, relative
+          to the agent's workspace.
+
+    Returns:
+        list[int] | None: The media IDs to pass to `update_status`.
+    """
+
+    if not media_path:
+        return None
+
+    # Only files in the agent's workspace may be attached.
+    from autogpt.workspace import path_in_workspace
+
+    media = chunked_media_upload(plugin.api, str(path_in_workspace(media_path)))
+    return [media.media_id]
+
+
 def get_mentions() -> str | None:
     """Gets the most recent mention.
 
@@ -73,20 +110,135 @@ def search_twitter_user(target_user: str, number_of_tweets: int) -> str:
         str: The dataframe containing the tweets.
     """
 
-    tweets = tweepy.Cursor(
-        plugin.api.user_timeline, screen_name=target_user, tweet_mode="extended"
-    ).items(number_of_tweets)
+    data = _fetch_user_timeline(target_user, number_of_tweets)
 
-    columns = ["Time", "User", "ID", "Tweet"]
-    data = []
+    df = str(pd.DataFrame(data, columns=TIMELINE_COLUMNS))
 
-    for tweet in tweets:
-        data.append(
-            [tweet.created_at, tweet.user.screen_name, tweet.id, tweet.full_text]
-        )
+    print(df)
+
+    return df  # Prints a dataframe object containing the Time, User, ID, and Tweet
+
+
+def get_stream_tweets(max_tweets: int = 50) -> str:
+    """Drains the tweets received by the background stream since the last
+      call. No request is sent to Twitter.
+
+    Args:
+        max_tweets (int): The maximum number of tweets to return.
+
+    Returns:
+        str: The dataframe containing the streamed tweets, oldest first.
+    """
+
+    data = plugin.tweet_buffer.drain(int(max_tweets))
 
-    df = str(pd.DataFrame(data, columns=columns))
+    df = str(pd.DataFrame(data, columns=TIMELINE_COLUMNS))
 
     print(df)
 
-    return df  # Prints a dataframe object containing the Time, User, ID, and Tweet
+    return df
+
+
+def search_twitter_users(
+    target_users: Union[str, List[str]], number_of_tweets: int
+) -> str:
+    """Searches the timelines of several users concurrently and returns the
+      tweets merged into one dataframe, newest first.
+
+    Args:
+        target_users (str | list[str]): The users to search, either as a list
+          or as a comma separated string of screen names.
+        number_of_tweets (int): The number of items to retrieve per user.
+
+    Returns:
+        str: The dataframe containing the tweets of all users.
+    """
+
+    if isinstance(target_users, str):
+        target_users = target_users.split(",")
+    users = [user.strip().lstrip("@") for user in target_users]
+    users = list(dict.fromkeys(user for user in users if user))
+    number_of_tweets = int(number_of_tweets)
+
+    data = []
+    rate_limited = []
+    if users:
+        workers = min(MAX_TIMELINE_WORKERS, len(users))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as tp:
+            futures = {
+                tp.submit(_fetch_user_timeline_partial, user, number_of_tweets): user
+                for user in users
+            }
+            for fut in concurrent.futures.as_completed(futures):
+                try:
+                    rows, limited = fut.result()
+                except tweepy.TweepyException as e:
+                    print(f"Could not fetch tweets of @{futures[fut]}: {e}")
+                    continue
+                data.extend(rows)
+                if limited:
+                    rate_limited.append(futures[fut])
+
+    data.sort(key=lambda row: row[0], reverse=True)
+
+    df = str(pd.DataFrame(data, columns=TIMELINE_COLUMNS))
+    if rate_limited:
+        # Keep the order the users were given in.
+        rate_limited.sort(key=users.index)
+        df += "\nRate limited, tweets may be missing for: " + ", ".join(
+            f"@{user}" for user in rate_limited
+        )
+
+    print(df)
+
+    return df
+
+
+def _fetch_user_timeline_partial(
+    target_user: str, number_of_tweets: int
+) -> Tuple[List[list], bool]:
+    """Retrieves the most recent tweets of a single user, stopping early
+      instead of waiting when the rate limit is exhausted.
+
+    Args:
+        target_user (str): The user to search.
+        number_of_tweets (int): The number of items to retrieve.
+
+    Returns:
+        tuple[list[list], bool]: The rows fetched, and whether the rate limit
+          cut the timeline short.
+    """
+
+    rows = []
+    try:
+        for row in _iter_user_timeline(target_user, number_of_tweets):
+            rows.append(row)
+    except tweepy.TooManyRequests:
+        return rows, True
+    return rows, False
+
+
+def _fetch_user_timeline(target_user: str, number_of_tweets: int) -> List[list]:
+    """Retrieves the most recent tweets of a single user as dataframe rows.
+
+    Args:
+        target_user (str): The user to search.
+        number_of_tweets (int): The number of items to retrieve.
+
+    Returns:
+        list[list]: One `[Time, User, ID, Tweet]` row per tweet.
+    """
+
+    return list(_iter_user_timeline(target_user, number_of_tweets))
+
+
+def _iter_user_timeline(target_user: str, number_of_tweets: int) -> Iterator[list]:
+    """Yields the most recent tweets of a single user as dataframe rows, one
+      page request at a time."""
+
+    tweets = tweepy.Cursor(
+        plugin.api.user_timeline, screen_name=target_user, tweet_mode="extended"
+    ).items(number_of_tweets)
+
+    for tweet in tweets:
+        yield [tweet.created_at, tweet.user.screen_name, tweet.id, tweet.full_text]
@@ -2,7 +2,13 @@
 from typing import Any, Dict, List, Optional, Tuple, TypedDict, TypeVar
 
 from auto_gpt_plugin_template import AutoGPTPluginTemplate
-from .wikipedia_search import _wikipedia_search
+from .wikipedia_search import (
+    _wikipedia_search,
+    _wikipedia_search_paged,
+    _wikipedia_section_text,
+    _wikipedia_sections,
+    _wikipedia_summaries,
+)
 
 PromptGenerator = TypeVar("PromptGenerator")
 
@@ -206,7 +212,44 @@ class AutoGPTWikipediaSearch(AutoGPTPluginTemplate):
         prompt.add_command(
             "wikipedia_search",
             "Wikipedia search",
-            {"query": "<query>"},
+            {
+                "query": "<query>",
+                "num_results": "<num_results>",
+                "languages": "<optional_comma_separated_language_codes>",
+                "output_format": "<json|compact|jsonl|text>",
+            },
             _wikipedia_search
         )
+        prompt.add_command(
+            "wikipedia_search_paged",
+            "Wikipedia search, one page of results at a time",
+            {
+                "query": "<query>",
+                "num_results": "<num_results>",
+                "offset": "<next_offset_of_previous_page>",
+                "output_format": "<json|compact|jsonl|text>",
+            },
+            _wikipedia_search_paged
+        )
+        prompt.add_command(
+            "wikipedia_summaries",
+            "Get the introductions of Wikipedia pages",
+            {"page_ids": "<comma_separated_page_ids_or_urls>"},
+            _wikipedia_summaries
+        )
+        prompt.add_command(
+            "wikipedia_sections",
+            "Get the section outline of a Wikipedia article",
+            {"page": "<title_or_page_id>"},
+            _wikipedia_sections
+        )
+        prompt.add_command(
+            "wikipedia_section_text",
+            "Get the text of selected sections of a Wikipedia article",
+            {
+                "page": "<title_or_page_id>",
+                "sections": "<comma_separated_section_indexes>",
+            },
+            _wikipedia_section_text
+        )
         return prompt
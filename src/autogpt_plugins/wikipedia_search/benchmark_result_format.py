@@ -0,0 +1,82 @@
+"""Size benchmark for the search result formats in `result_format.py`.
+
+Serializes the Wikipedia and Bing result sets in
+`benchmark_data/search_results.json`, cleaned the way the plugins clean them,
+in every output format and reports their size in bytes and tokens. Tokens are
+counted with tiktoken's `cl100k_base` encoding when tiktoken is installed, and
+estimated as bytes / 4 otherwise.
+
+Usage:
+    python -m autogpt_plugins.wikipedia_search.benchmark_result_format
+
+Pass `--snippet-length N` to measure snippets capped at N characters.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+
+from .benchmark_snippets import DATA_PATH
+from .result_format import OUTPUT_FORMATS, format_results
+from .snippets import normalize_snippets
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def load_results() -> dict[str, list[dict]]:
+    """Return the recorded result sets as the plugins return them."""
+    with open(DATA_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+
+    wikipedia = data["wikipedia"]["query"]["search"]
+    summaries = normalize_snippets([item["snippet"] for item in wikipedia])
+    bing = data["bing"]["webPages"]["value"]
+    texts = normalize_snippets(
+        [text for item in bing for text in (item["name"], item["snippet"])]
+    )
+    return {
+        "wikipedia": [
+            {
+                "title": item["title"],
+                "summary": summary,
+                "url": f"http://en.wikipedia.org/?curid={item['pageid']}",
+            }
+            for item, summary in zip(wikipedia, summaries)
+        ],
+        "bing": [
+            {"title": texts[2 * i], "href": item["url"], "body": texts[2 * i + 1]}
+            for i, item in enumerate(bing)
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippet-length", type=int, default=0)
+    args = parser.parse_args()
+
+    if tiktoken is not None:
+        encoding = tiktoken.get_encoding("cl100k_base")
+        count_tokens = lambda text: len(encoding.encode(text))  # noqa: E731
+    else:
+        print("tiktoken is not installed, tokens are estimated as bytes / 4")
+        count_tokens = lambda text: round(len(text.encode()) / 4)  # noqa: E731
+
+    for name, results in load_results().items():
+        baseline = None
+        for output_format in OUTPUT_FORMATS:
+            text = format_results(results, output_format, args.snippet_length)
+            size = len(text.encode())
+            tokens = count_tokens(text)
+            baseline = baseline or tokens
+            print(
+                f"{name:<10} {output_format:<8} {size:7,d} bytes "
+                f"{tokens:6,d} tokens   {tokens / baseline:6.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
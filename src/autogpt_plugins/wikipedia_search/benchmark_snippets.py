@@ -0,0 +1,87 @@
+"""Throughput benchmark for `snippets.normalize_snippets`.
+
+Compares the batched normalizer with the per-field cleaning previously done by
+`wikipedia_search.py` and `bing_search.py`, over the result sets in
+`benchmark_data/search_results.json`. Each path cleans the fields it cleaned
+before: Wikipedia snippets, and Bing titles and snippets.
+
+Usage:
+    python -m autogpt_plugins.wikipedia_search.benchmark_snippets
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import timeit
+
+from .snippets import normalize_snippets
+
+DATA_PATH = os.path.join(
+    os.path.dirname(__file__), "benchmark_data", "search_results.json"
+)
+
+# The cleaning that `wikipedia_search.py` and `bing_search.py` used to do.
+HTML_TAG_CLEANER = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+
+
+def wikipedia_clean(snippets: list[str]) -> list[str]:
+    return [re.sub(HTML_TAG_CLEANER, "", snippet) for snippet in snippets]
+
+
+def bing_clean_text(text: str) -> str:
+    cleaned_text = re.sub("<[^>]*>", "", text)
+    cleaned_text = cleaned_text.replace("\\n", " ")
+    return cleaned_text
+
+
+def bing_clean(fields: list[str]) -> list[str]:
+    return [bing_clean_text(field) for field in fields]
+
+
+def load_fields() -> dict[str, list[str]]:
+    with open(DATA_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        "wikipedia": [item["snippet"] for item in data["wikipedia"]["query"]["search"]],
+        "bing": [
+            field
+            for item in data["bing"]["webPages"]["value"]
+            for field in (item["name"], item["snippet"])
+        ],
+    }
+
+
+def _throughputs(functions, fields: list[str], number: int, repeat: int) -> list:
+    """Return the best observed number of fields cleaned per second by each
+    function. Runs are interleaved so that drift in CPU speed affects all
+    functions alike."""
+    best = [float("inf")] * len(functions)
+    for _ in range(repeat):
+        for i, function in enumerate(functions):
+            elapsed = timeit.timeit(lambda: function(fields), number=number)
+            best[i] = min(best[i], elapsed)
+    return [len(fields) * number / elapsed for elapsed in best]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=21)
+    args = parser.parse_args()
+
+    current_paths = {"wikipedia": wikipedia_clean, "bing": bing_clean}
+    for name, fields in load_fields().items():
+        current, batched = _throughputs(
+            [current_paths[name], normalize_snippets], fields, args.number, args.repeat
+        )
+        print(
+            f"{name:<10} {len(fields):3d} fields   "
+            f"current {current:12,.0f}/s   batched {batched:12,.0f}/s   "
+            f"{batched / current:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Latency benchmark for the pooled Wikipedia session.
+
+Runs `_wikipedia_search` against a local HTTP stand-in for the Wikipedia API,
+once with a fresh `requests.Session` per query (the previous behaviour) and
+once with the shared keep-alive session. Every new connection to the stand-in
+is delayed by `--handshake-ms` to stand in for the DNS, TCP and TLS setup of a
+real connection to en.wikipedia.org.
+
+Usage:
+    python -m autogpt_plugins.wikipedia_search.benchmark_wikipedia_search
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import requests
+
+from . import wikipedia_search
+
+SEARCH_RESPONSE = json.dumps(
+    {
+        "batchcomplete": True,
+        "query": {
+            "searchinfo": {"totalhits": 5},
+            "search": [
+                {
+                    "ns": 0,
+                    "title": f"Result {i}",
+                    "pageid": i,
+                    "snippet": f'<span class="searchmatch">Result</span> {i}',
+                }
+                for i in range(5)
+            ],
+        },
+    }
+).encode()
+
+
+class _WikipediaStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(SEARCH_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(SEARCH_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class _HandshakeDelayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    handshake_delay = 0.0
+
+    def get_request(self):
+        # Headers and body are written separately; disable Nagle so keep-alive
+        # responses are not held back by delayed ACKs.
+        request, client_address = super().get_request()
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return request, client_address
+
+    def process_request_thread(self, request, client_address):
+        time.sleep(self.handshake_delay)
+        super().process_request_thread(request, client_address)
+
+
+def _time_queries(queries: int) -> list[float]:
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        wikipedia_search._wikipedia_search(f"query {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def _report(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<8} mean {statistics.mean(latencies):7.2f} ms   "
+        f"p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server = _HandshakeDelayServer(("127.0.0.1", 0), _WikipediaStandIn)
+    server.handshake_delay = args.handshake_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+
+    with patch.object(wikipedia_search, "WIKIPEDIA_API_URL", api_url), patch.object(
+        wikipedia_search._cache, "ttl", 0
+    ):
+        with patch.object(
+            wikipedia_search, "_get_session", lambda: requests.Session()
+        ):
+            cold = _time_queries(args.queries)
+        wikipedia_search._wikipedia_search("warm-up")
+        warm = _time_queries(args.queries)
+
+    server.shutdown()
+    _report("cold", cold)
+    _report("pooled", warm)
+    print(f"speed-up {statistics.mean(cold) / statistics.mean(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
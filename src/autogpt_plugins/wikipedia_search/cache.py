@@ -0,0 +1,215 @@
+"""Two-tier cache for Wikipedia API responses."""
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WikipediaCache:
+    """
+    An in-memory LRU in front of an on-disk SQLite store.
+
+    Entries are fresh for `ttl` seconds. Expired entries are kept for another
+    `stale_ttl` seconds; during that window they are still returned at once
+    while a refresh runs in the background (stale-while-revalidate).
+    Values must be JSON serializable. If the SQLite store cannot be used,
+    entries are only kept in memory.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        ttl: float,
+        stale_ttl: float = 0,
+        max_entries: int = 256,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._refreshing = set()
+        self._refresher = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="wikipedia-cache"
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, calling `fetch` on a miss.
+        Args:
+            key (Hashable): The normalized cache key.
+            fetch (Callable[[], Any]): Returns the live value.
+        Returns:
+            Any: The cached or freshly fetched value.
+        """
+        if not self.enabled:
+            return fetch()
+
+        cache_key = json.dumps(key, ensure_ascii=False)
+        entry = self._get(cache_key)
+        now = time.time()
+        if entry is not None:
+            value, stored_at = entry
+            age = now - stored_at
+            if age <= self.ttl:
+                self.hits += 1
+                return value
+            if age <= self.ttl + self.stale_ttl:
+                self.hits += 1
+                self._refresh_in_background(cache_key, fetch)
+                return value
+
+        self.misses += 1
+        value = fetch()
+        self._set(cache_key, value, now)
+        return value
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for `key` if it is still fresh.
+        Args:
+            key (Hashable): The normalized cache key.
+        Returns:
+            Optional[Any]: The cached value, or None.
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._get(json.dumps(key, ensure_ascii=False))
+        if entry is not None and time.time() - entry[1] <= self.ttl:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`.
+        Args:
+            key (Hashable): The normalized cache key.
+            value (Any): The JSON serializable value.
+        """
+        if self.enabled:
+            self._set(json.dumps(key, ensure_ascii=False), value, time.time())
+
+    def clear(self) -> None:
+        """Remove all entries from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._connect()
+                if db is not None:
+                    db.execute("DELETE FROM cache")
+                    db.commit()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(
+                    "Could not clear the Wikipedia cache %s: %s", self.path, e
+                )
+
+    def _refresh_in_background(self, cache_key: str, fetch: Callable[[], Any]):
+        with self._lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def refresh():
+            try:
+                self._set(cache_key, fetch(), time.time())
+            except Exception:
+                # Keep serving the stale entry; the next read retries.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+
+        self._refresher.submit(refresh)
+
+    def _get(self, cache_key: str) -> Optional[tuple[Any, float]]:
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                self._memory.move_to_end(cache_key)
+                return entry
+
+            row = None
+            try:
+                db = self._connect()
+                if db is not None:
+                    row = db.execute(
+                        "SELECT value, stored_at FROM cache WHERE key = ?",
+                        (cache_key,),
+                    ).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(
+                    "Could not read the Wikipedia cache %s: %s", self.path, e
+                )
+            if row is None:
+                return None
+            entry = (json.loads(row[0]), row[1])
+            self._remember(cache_key, entry)
+            return entry
+
+    def _set(self, cache_key: str, value: Any, stored_at: float) -> None:
+        with self._lock:
+            self._remember(cache_key, (value, stored_at))
+            try:
+                db = self._connect()
+                if db is None:
+                    return
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at) "
+                    "VALUES (?, ?, ?)",
+                    (cache_key, json.dumps(value, ensure_ascii=False), stored_at),
+                )
+                db.execute(
+                    "DELETE FROM cache WHERE stored_at < ?",
+                    (time.time() - self.ttl - self.stale_ttl,),
+                )
+                db.commit()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(
+                    "Could not write the Wikipedia cache %s: %s", self.path, e
+                )
+
+    def _remember(self, cache_key: str, entry: tuple[Any, float]) -> None:
+        self._memory[cache_key] = entry
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite store on first use. Callers must hold the lock."""
+        if self._db is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, "
+                    "value TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+                # Expired rows are deleted on every write.
+                db.execute(
+                    "CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)"
+                )
+            except sqlite3.Error:
+                db.close()
+                raise
+            self._db = db
+        return self._db
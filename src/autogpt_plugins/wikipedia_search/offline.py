@@ -0,0 +1,400 @@
+"""Offline Wikipedia search backed by a local multistream dump.
+
+A `pages-articles-multistream.xml.bz2` dump is a concatenation of bz2 streams
+of 100 pages each, and its `pages-articles-multistream-index.txt.bz2` lists
+the byte offset of the stream holding every page. `build_offline_index` turns
+them into two prebuilt indexes:
+
+- a sorted title index, read through `mmap` and binary searched, that maps a
+  title to its page ID and stream offset, so a page is read by decompressing
+  only its own stream;
+- a contentless SQLite FTS5 full-text index over the title and lead of every
+  article, ranked with BM25, plus a table with a short summary per page.
+
+Usage:
+    python -m autogpt_plugins.wikipedia_search.offline \\
+        <pages-articles-multistream.xml.bz2> \\
+        <pages-articles-multistream-index.txt.bz2> <output_dir>
+"""
+from __future__ import annotations
+
+import argparse
+import bz2
+import html
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+import xml.etree.ElementTree as ElementTree
+from typing import Iterator, Optional
+
+TITLE_INDEX_FILE = "titles.idx"
+TITLE_DATA_FILE = "titles.dat"
+FULLTEXT_FILE = "fulltext.sqlite3"
+# Scratch database the title index is sorted in, removed once it is built.
+TITLE_SORT_FILE = "titles.sort.sqlite3"
+
+# (title data offset, stream offset, page ID) per title, sorted by title key.
+TITLE_RECORD = struct.Struct("<QQQ")
+
+# Only the lead of each article is indexed, which keeps the index compact.
+INDEXED_CHARS = 4000
+SUMMARY_CHARS = 300
+
+STREAM_READ_SIZE = 64 * 1024
+
+WIKITEXT_CLEANERS = [
+    (re.compile(r"<!--.*?-->", re.DOTALL), ""),
+    (re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.DOTALL), ""),
+    (re.compile(r"\{\|.*?\|\}", re.DOTALL), ""),
+    (
+        re.compile(
+            r"\[\[(?:File|Image|Category):"
+            r"[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]"
+        ),
+        "",
+    ),
+    (re.compile(r"\[\[(?:[^|\]]*\|)?([^\]]*)\]\]"), r"\1"),
+    (re.compile(r"\[https?://\S+ ?([^\]]*)\]"), r"\1"),
+    (re.compile(r"<[^>]+>"), ""),
+    (re.compile(r"'{2,}"), ""),
+    (re.compile(r"^=+\s*(.*?)\s*=+\s*$", re.MULTILINE), r"\1."),
+]
+WIKITEXT_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+WIKITEXT_REDIRECT = re.compile(r"#REDIRECT\s*\[\[([^\]|#]+)", re.IGNORECASE)
+# Query terms as the FTS5 unicode61 tokenizer splits them. It treats "_" as a
+# separator, and "foo_bar" would become a phrase, which a detail=column index
+# cannot match.
+QUERY_TERM = re.compile(r"[^\W_]+")
+
+
+def normalize_title(title: str) -> str:
+    return " ".join(title.replace("_", " ").split()).casefold()
+
+
+def wikitext_to_text(wikitext: str) -> str:
+    """Reduce wikitext to plain prose, good enough for indexing and summaries."""
+    # Templates nest, so strip the innermost ones until none are left.
+    previous = None
+    while previous != wikitext:
+        previous = wikitext
+        wikitext = WIKITEXT_TEMPLATE.sub("", wikitext)
+    for pattern, replacement in WIKITEXT_CLEANERS:
+        wikitext = pattern.sub(replacement, wikitext)
+    return " ".join(html.unescape(wikitext).split())
+
+
+class OfflineWikipedia:
+    """
+    Read-only access to a local dump through its prebuilt indexes.
+    """
+
+    def __init__(self, dump_path: str, index_dir: str):
+        self.dump_path = dump_path
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, TITLE_INDEX_FILE), "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(os.path.join(index_dir, TITLE_DATA_FILE), "rb") as f:
+            self._titles = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._count = len(self._records) // TITLE_RECORD.size
+        self._db = sqlite3.connect(
+            f"file:{os.path.join(index_dir, FULLTEXT_FILE)}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+        self._db_lock = threading.Lock()
+
+    def search(
+        self, query: str, num_results: int, offset: int = 0
+    ) -> tuple[list[dict], Optional[int]]:
+        """Return a page of results in the same shape as the online search.
+        Args:
+            query (str): The search query.
+            num_results (int): The number of results to return.
+            offset (int): The number of results to skip.
+        Returns:
+            tuple[list[dict], Optional[int]]: The results and the offset of the
+                next page, or None if there are no more results.
+        """
+        # A page whose title matches the query exactly always ranks first, the
+        # full-text results follow without it. Offsets count both.
+        exact = self._resolve(query)
+        items = []
+        fulltext_offset = offset
+        if exact is not None:
+            if offset == 0:
+                items.append(self._item(*exact))
+            else:
+                fulltext_offset -= 1
+
+        rows = []
+        needed = num_results - len(items)
+        terms = QUERY_TERM.findall(query)
+        if terms:
+            match = " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT pages.pageid, pages.title, pages.summary "
+                    "FROM fulltext JOIN pages ON pages.pageid = fulltext.rowid "
+                    "WHERE fulltext MATCH ? AND fulltext.rowid != ? "
+                    "ORDER BY rank LIMIT ? OFFSET ?",
+                    (
+                        match,
+                        exact[1] if exact is not None else -1,
+                        needed + 1,
+                        fulltext_offset,
+                    ),
+                ).fetchall()
+        for page_id, title, summary in rows[:needed]:
+            items.append(self._item(title, page_id, summary))
+
+        next_offset = offset + len(items) if len(rows) > needed else None
+        return items, next_offset
+
+    def lookup(self, title: str) -> Optional[tuple[int, str, int]]:
+        """Find a page by title in the memory-mapped title index.
+        Args:
+            title (str): The page title, in any case.
+        Returns:
+            Optional[tuple[int, str, int]]: The stream offset, exact title and
+                page ID, or None if there is no such page.
+        """
+        key = normalize_title(title).encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+
+        # Several titles can share a key when they differ only in case.
+        matches = []
+        while low < self._count:
+            record_key, record_title, stream_offset, page_id = self._record(low)
+            if record_key != key:
+                break
+            matches.append((stream_offset, record_title, page_id))
+            low += 1
+        for match in matches:
+            if match[1] == title:
+                return match
+        return matches[0] if matches else None
+
+    def page_wikitext(self, stream_offset: int, page_id: int) -> Optional[str]:
+        """Return the wikitext of a page, decompressing only its stream.
+        Args:
+            stream_offset (int): The byte offset of the page's bz2 stream.
+            page_id (int): The page ID.
+        Returns:
+            Optional[str]: The wikitext, or None if the page was not found.
+        """
+        for page in _iter_pages(_read_stream(self.dump_path, stream_offset)):
+            if page["id"] == page_id:
+                return page["text"]
+        return None
+
+    def _resolve(self, title: str) -> Optional[tuple[str, int, str]]:
+        """Return the title, page ID and summary of the article with this
+        title, following one redirect."""
+        for _ in range(2):
+            page = self.lookup(title)
+            if page is None:
+                return None
+            stream_offset, title, page_id = page
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT summary FROM pages WHERE pageid = ?", (page_id,)
+                ).fetchone()
+            if row is not None:
+                return title, page_id, row[0]
+
+            # Redirects and non-article pages are not in the full-text index.
+            wikitext = self.page_wikitext(stream_offset, page_id) or ""
+            redirect = WIKITEXT_REDIRECT.match(wikitext.lstrip())
+            if redirect is None:
+                return title, page_id, wikitext_to_text(wikitext)[:SUMMARY_CHARS]
+            title = redirect.group(1)
+        return None
+
+    @staticmethod
+    def _item(title: str, page_id: int, summary: str) -> dict:
+        return {
+            "title": title,
+            "summary": summary,
+            "url": f"http://en.wikipedia.org/?curid={page_id}",
+        }
+
+    def _record(self, position: int) -> tuple[bytes, str, int, int]:
+        data_offset, stream_offset, page_id = TITLE_RECORD.unpack_from(
+            self._records, position * TITLE_RECORD.size
+        )
+        end = self._titles.find(b"\n", data_offset)
+        key, title = self._titles[data_offset:end].split(b"\t", 1)
+        return key, title.decode("utf-8"), stream_offset, page_id
+
+
+def build_offline_index(dump_path: str, index_path: str, output_dir: str) -> None:
+    """Build the title and full-text indexes for a multistream dump.
+    Args:
+        dump_path (str): The `pages-articles-multistream.xml.bz2` file.
+        index_path (str): The `pages-articles-multistream-index.txt.bz2` file.
+        output_dir (str): The directory to write the indexes to.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    _build_title_index(index_path, output_dir)
+    _build_fulltext_index(dump_path, output_dir)
+
+
+def _build_title_index(index_path: str, output_dir: str) -> None:
+    # The index of a large dump lists tens of millions of pages, far too many
+    # to sort in memory. The entries are streamed into a scratch SQLite table
+    # instead, whose ORDER BY sorts on disk. Keys are BLOBs, which compare
+    # byte by byte like the binary search in `lookup`.
+    sort_path = os.path.join(output_dir, TITLE_SORT_FILE)
+    if os.path.exists(sort_path):
+        os.remove(sort_path)
+    db = sqlite3.connect(sort_path)
+    try:
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute(
+            "CREATE TABLE titles "
+            "(key BLOB, title BLOB, stream_offset INTEGER, page_id INTEGER)"
+        )
+        with bz2.open(index_path, "rt", encoding="utf-8") as f:
+            db.executemany(
+                "INSERT INTO titles VALUES (?, ?, ?, ?)", _iter_title_entries(f)
+            )
+        db.commit()
+
+        with open(os.path.join(output_dir, TITLE_DATA_FILE), "wb") as data, open(
+            os.path.join(output_dir, TITLE_INDEX_FILE), "wb"
+        ) as records:
+            rows = db.execute(
+                "SELECT key, title, stream_offset, page_id FROM titles "
+                "ORDER BY key, rowid"
+            )
+            for key, title, stream_offset, page_id in rows:
+                records.write(TITLE_RECORD.pack(data.tell(), stream_offset, page_id))
+                data.write(key + b"\t" + title + b"\n")
+    finally:
+        db.close()
+        os.remove(sort_path)
+
+
+def _iter_title_entries(lines) -> Iterator[tuple[bytes, bytes, int, int]]:
+    for line in lines:
+        stream_offset, page_id, title = line.rstrip("\n").split(":", 2)
+        key = normalize_title(title).encode("utf-8")
+        yield key, title.encode("utf-8"), int(stream_offset), int(page_id)
+
+
+def _build_fulltext_index(dump_path: str, output_dir: str) -> None:
+    path = os.path.join(output_dir, FULLTEXT_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE VIRTUAL TABLE fulltext USING fts5"
+        "(title, body, content='', detail=column)"
+    )
+    db.execute(
+        "CREATE TABLE pages (pageid INTEGER PRIMARY KEY, title TEXT, summary TEXT)"
+    )
+    with bz2.open(dump_path, "rb") as f:
+        for page in _iter_pages(f):
+            if page["ns"] != 0 or page["redirect"]:
+                continue
+            text = wikitext_to_text(page["text"][: INDEXED_CHARS * 4])
+            db.execute(
+                "INSERT INTO fulltext (rowid, title, body) VALUES (?, ?, ?)",
+                (page["id"], page["title"], text[:INDEXED_CHARS]),
+            )
+            db.execute(
+                "INSERT INTO pages (pageid, title, summary) VALUES (?, ?, ?)",
+                (page["id"], page["title"], text[:SUMMARY_CHARS]),
+            )
+    db.execute("INSERT INTO fulltext (fulltext) VALUES ('optimize')")
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+
+
+def _read_stream(dump_path: str, stream_offset: int) -> bytes:
+    """Decompress the single bz2 stream that starts at `stream_offset`."""
+    decompressor = bz2.BZ2Decompressor()
+    chunks = []
+    with open(dump_path, "rb") as f:
+        f.seek(stream_offset)
+        while not decompressor.eof:
+            data = f.read(STREAM_READ_SIZE)
+            if not data:
+                break
+            chunks.append(decompressor.decompress(data))
+    return b"".join(chunks)
+
+
+def _iter_pages(source) -> Iterator[dict]:
+    """Yield the pages in a dump, or in a fragment of one stream of it.
+
+    `source` is either the bytes of a decompressed stream, which holds bare
+    `<page>` elements, or a binary file object for the whole dump.
+    """
+    if isinstance(source, bytes):
+        source = _PageFragment(source)
+    root = None
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if root is None:
+            root = element
+        if event != "end" or _local_name(element.tag) != "page":
+            continue
+        fields = {_local_name(child.tag): child for child in element}
+        revision = {_local_name(child.tag): child for child in fields["revision"]}
+        yield {
+            "id": int(fields["id"].text),
+            "ns": int(fields["ns"].text),
+            "title": fields["title"].text,
+            "redirect": "redirect" in fields,
+            "text": revision["text"].text or "",
+        }
+        # Drop finished pages so memory stays flat over a whole dump.
+        root.clear()
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+class _PageFragment:
+    """File-like wrapper that gives the pages of one stream a single root."""
+
+    def __init__(self, data: bytes):
+        # The first stream also holds the <mediawiki> and <siteinfo> opening.
+        start = data.find(b"<page>")
+        end = data.rfind(b"</page>")
+        if start == -1 or end == -1:
+            data = b""
+        else:
+            data = data[start : end + len(b"</page>")]
+        self._parts = [b"<pages>", data, b"</pages>"]
+
+    def read(self, size: int = -1) -> bytes:
+        return self._parts.pop(0) if self._parts else b""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build an offline Wikipedia index.")
+    parser.add_argument("dump", help="pages-articles-multistream.xml.bz2")
+    parser.add_argument("index", help="pages-articles-multistream-index.txt.bz2")
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+    build_offline_index(args.dump, args.index, args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
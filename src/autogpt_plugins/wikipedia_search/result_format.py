@@ -0,0 +1,166 @@
+"""Serialization of search results for the agent.
+
+Every character of a command result is carried through the agent loop and
+billed as prompt tokens, so the format can be chosen with
+`SEARCH_RESULT_FORMAT`:
+
+- `json`: indented JSON, as the plugins used to return.
+- `compact`: JSON without whitespace between tokens. This is the default.
+- `jsonl`: one compact JSON object per line.
+- `text`: one `title | url | snippet` line per result.
+
+`SEARCH_SNIPPET_LENGTH` caps the length of snippets and summaries, 0 (the
+default) leaves them whole.
+
+Auto-GPT loads every plugin as its own top-level package, so the Bing,
+Wikipedia and News plugins each keep an identical copy of this module.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+OUTPUT_FORMATS = ("json", "compact", "jsonl", "text")
+# Keys holding the snippet of a result in the Bing and Wikipedia plugins.
+SNIPPET_KEYS = ("body", "summary")
+URL_KEYS = ("url", "href")
+
+Results = Union[List[dict], Dict[str, List[dict]]]
+
+
+def format_results(
+    results: Results,
+    output_format: Optional[str] = None,
+    snippet_length: Optional[int] = None,
+) -> str:
+    """Serialize search results.
+
+    Args:
+        results (Results): A list of results, or lists of results keyed by
+                           group (for example the Bing vertical).
+        output_format (Optional[str]): One of `OUTPUT_FORMATS`. Defaults to
+                                       `SEARCH_RESULT_FORMAT`.
+        snippet_length (Optional[int]): Maximum snippet length, 0 for none.
+                                        Defaults to `SEARCH_SNIPPET_LENGTH`.
+
+    Returns:
+        str: The serialized results.
+    """
+    output_format = _output_format(output_format)
+    results = _cap_snippets(results, _snippet_length(snippet_length))
+
+    if output_format == "json":
+        return json.dumps(results, ensure_ascii=False, indent=4)
+    if output_format == "compact":
+        return _compact_json(results)
+
+    if isinstance(results, dict):
+        # Flatten the groups, labelling each result with its group.
+        records = [
+            (group, result) for group, items in results.items() for result in items
+        ]
+    else:
+        records = [(None, result) for result in results]
+    if output_format == "jsonl":
+        return "\n".join(
+            _compact_json(result if group is None else {"type": group, **result})
+            for group, result in records
+        )
+    return "\n".join(_text_line(result, group) for group, result in records)
+
+
+def format_page(
+    results: List[dict],
+    next_offset: Optional[int],
+    output_format: Optional[str] = None,
+    snippet_length: Optional[int] = None,
+) -> str:
+    """Serialize one page of search results and the offset of the next page.
+
+    The JSON formats return `{"results": [...], "next_offset": <offset>}`,
+    `jsonl` and `text` end with a line holding the offset.
+
+    Args:
+        results (List[dict]): The results of the page.
+        next_offset (Optional[int]): The offset of the next page, None if
+                                     this is the last one.
+        output_format (Optional[str]): See `format_results`.
+        snippet_length (Optional[int]): See `format_results`.
+
+    Returns:
+        str: The serialized page.
+    """
+    output_format = _output_format(output_format)
+    if output_format in ("jsonl", "text"):
+        lines = format_results(results, output_format, snippet_length)
+        if output_format == "jsonl":
+            last = _compact_json({"next_offset": next_offset})
+        else:
+            last = f"next_offset: {_compact_json(next_offset)}"
+        return f"{lines}\n{last}" if lines else last
+
+    page = {
+        "results": _cap_snippets(results, _snippet_length(snippet_length)),
+        "next_offset": next_offset,
+    }
+    if output_format == "json":
+        return json.dumps(page, ensure_ascii=False, indent=4)
+    return _compact_json(page)
+
+
+def truncate_snippet(snippet: str, length: int) -> str:
+    """Shorten `snippet` to at most `length` characters, at a word boundary
+    where possible, marking the cut with an ellipsis."""
+    if len(snippet) <= length:
+        return snippet
+    cut = snippet[: length - 1]
+    space = cut.rfind(" ")
+    if space > length // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;:.") + "…"
+
+
+def _output_format(output_format: Optional[str]) -> str:
+    if output_format is None:
+        output_format = os.getenv("SEARCH_RESULT_FORMAT") or "compact"
+    output_format = output_format.lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown output format {output_format!r}, choose from {OUTPUT_FORMATS}"
+        )
+    return output_format
+
+
+def _snippet_length(snippet_length: Optional[int]) -> int:
+    if snippet_length is None:
+        snippet_length = int(os.getenv("SEARCH_SNIPPET_LENGTH") or 0)
+    return snippet_length
+
+
+def _cap_snippets(results: Results, length: int) -> Results:
+    if length <= 0:
+        return results
+    if isinstance(results, dict):
+        return {group: _cap_snippets(items, length) for group, items in results.items()}
+    return [
+        {
+            key: truncate_snippet(value, length)
+            if key in SNIPPET_KEYS and isinstance(value, str)
+            else value
+            for key, value in result.items()
+        }
+        for result in results
+    ]
+
+
+def _compact_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _text_line(result: dict, group: Optional[str]) -> str:
+    url = next((result[key] for key in URL_KEYS if result.get(key)), "")
+    snippet = next((result[key] for key in SNIPPET_KEYS if result.get(key)), "")
+    fields = [result.get("title", ""), url, snippet]
+    line = " | ".join(str(field).replace("\n", " ") for field in fields if field)
+    return line if group is None else f"[{group}] {line}"
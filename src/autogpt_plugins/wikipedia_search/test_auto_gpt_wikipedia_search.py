@@ -0,0 +1,550 @@
+import bz2
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from . import cache, wikipedia_search
+from .cache import WikipediaCache
+from .offline import OfflineWikipedia, build_offline_index
+from .snippets import normalize_snippets
+from .wikipedia_search import (
+    _search_languages,
+    _wikipedia_search,
+    _wikipedia_search_paged,
+    _wikipedia_section_text,
+    _wikipedia_sections,
+    _wikipedia_summaries,
+)
+
+
+def extracts_response(params, language="en"):
+    return {
+        "query": {
+            "pages": [
+                {
+                    "pageid": int(page_id),
+                    "title": f"{language} {page_id}",
+                    "extract": f"Intro of {page_id}",
+                }
+                for page_id in params["pageids"].split("|")
+            ]
+        }
+    }
+
+
+class TestWikipediaSearch(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(wikipedia_search, "_cache", WikipediaCache(None, ttl=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(wikipedia_search, "_get_offline", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rejects_invalid_language(self):
+        with patch.object(wikipedia_search, "_get_session") as get_session:
+            result = _wikipedia_search("query", languages="attacker.example/#")
+        self.assertIn("invalid Wikipedia language code", result)
+        get_session.assert_not_called()
+
+        with self.assertRaises(ValueError):
+            wikipedia_search._api_get({}, language="attacker.example/#")
+
+    def test_summaries_keep_url_language(self):
+        api_get = MagicMock(side_effect=extracts_response)
+        with patch.object(wikipedia_search, "_api_get", api_get):
+            result = json.loads(
+                _wikipedia_summaries("http://de.wikipedia.org/?curid=5, 5, 7")
+            )
+
+        calls = api_get.call_args_list
+        self.assertEqual(
+            [(call.args[1], call.args[0]["pageids"]) for call in calls],
+            [("de", "5"), ("en", "5|7")],
+        )
+        self.assertEqual(
+            [(item["title"], item["url"]) for item in result],
+            [
+                ("de 5", "http://de.wikipedia.org/?curid=5"),
+                ("en 5", "http://en.wikipedia.org/?curid=5"),
+                ("en 7", "http://en.wikipedia.org/?curid=7"),
+            ],
+        )
+
+    def test_sections_keep_url_language(self):
+        api_get = MagicMock(
+            return_value={"parse": {"title": "Berlin", "pageid": 3, "sections": []}}
+        )
+        with patch.object(wikipedia_search, "_api_get", api_get):
+            _wikipedia_sections("https://de.wikipedia.org/?curid=3")
+            _wikipedia_sections("https://attacker.example/#.wikipedia.org/?curid=3")
+
+        self.assertEqual(
+            [(call.args[0]["pageid"], call.args[1]) for call in api_get.call_args_list],
+            [("3", "de"), ("3", "en")],
+        )
+
+    def test_normalize_snippets(self):
+        self.assertEqual(
+            normalize_snippets(
+                ['<span class="searchmatch">Py</span>thon &amp; co', "a\x00b", "c <d"]
+            ),
+            ["Python & co", "a\x00b", "c <d"],
+        )
+
+    def test_search_languages_dedupes_wikidata_items(self):
+        results = {
+            "en": [("Berlin", "Q64"), ("Bonn", "Q586"), ("Bern", None)],
+            "de": [("Berlin", "Q64"), ("Potsdam", "Q1711"), ("Bern", None)],
+        }
+
+        def search_page(query, num_results, language, wikidata):
+            self.assertTrue(wikidata)
+            items = [
+                {"title": f"{language} {title}", "wikidata": item}
+                for title, item in results[language][:num_results]
+            ]
+            return items, None
+
+        with patch.object(wikipedia_search, "_search_page", side_effect=search_page):
+            items = _search_languages("query", 5, ["en", "de"])
+
+        # Interleaved by rank, and without the internal wikidata key
+        self.assertEqual(
+            items,
+            [
+                {"title": "en Berlin", "language": "en"},
+                {"title": "en Bonn", "language": "en"},
+                {"title": "de Potsdam", "language": "de"},
+                {"title": "en Bern", "language": "en"},
+                {"title": "de Bern", "language": "de"},
+            ],
+        )
+
+    def test_search_languages_deadline(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def search_page(query, num_results, language, wikidata):
+            if language == "de":
+                release.wait(5)
+            if language == "fr":
+                raise ValueError("fr failed")
+            return [{"title": f"{language} result", "wikidata": None}], None
+
+        with patch.object(
+            wikipedia_search, "_search_page", side_effect=search_page
+        ), patch.object(wikipedia_search, "WIKIPEDIA_LANGUAGE_DEADLINE", 0.05):
+            items = _search_languages("query", 5, ["de", "en", "fr"])
+            self.assertEqual(items, [{"title": "en result", "language": "en"}])
+
+            with self.assertRaisesRegex(ValueError, "fr failed"):
+                _search_languages("query", 5, ["fr"])
+
+    def test_search_paged_output_format(self):
+        items = [
+            {"title": "T", "summary": "S", "url": "http://en.wikipedia.org/?curid=1"}
+        ]
+        search_page = MagicMock(return_value=(items, 1))
+        with patch.object(wikipedia_search, "_search_page", search_page):
+            compact = _wikipedia_search_paged("query", 1, output_format="compact")
+            text = _wikipedia_search_paged("query", 1, output_format="text")
+
+        self.assertNotIn("\n", compact)
+        self.assertEqual(json.loads(compact), {"results": items, "next_offset": 1})
+        self.assertEqual(
+            text.splitlines(),
+            ["T | http://en.wikipedia.org/?curid=1 | S", "next_offset: 1"],
+        )
+
+    def test_search_requests_only_needed_fields(self):
+        calls = []
+
+        def api_get(params, language):
+            calls.append(dict(params))
+            response = {
+                "query": {
+                    "search": [
+                        {
+                            "title": "Python",
+                            "pageid": 23862,
+                            "snippet": '<span class="searchmatch">Python</span> is',
+                        }
+                    ]
+                }
+            }
+            if "sroffset" not in params:
+                response["continue"] = {"sroffset": 1, "continue": "-||"}
+            return response
+
+        with patch.object(wikipedia_search, "_api_get", side_effect=api_get):
+            first = json.loads(_wikipedia_search_paged("python", 1, 0, "json"))
+            second = json.loads(
+                _wikipedia_search_paged("python", 1, first["next_offset"], "json")
+            )
+            _wikipedia_search_paged("python", 10000)
+
+        self.assertEqual(calls[0]["srlimit"], 1)
+        self.assertEqual(calls[0]["srprop"], "snippet")
+        self.assertNotIn("sroffset", calls[0])
+        self.assertEqual(calls[1]["sroffset"], 1)
+        self.assertEqual(calls[2]["srlimit"], 500)
+        self.assertEqual(
+            first,
+            {
+                "results": [
+                    {
+                        "title": "Python",
+                        "summary": "Python is",
+                        "url": "http://en.wikipedia.org/?curid=23862",
+                    }
+                ],
+                "next_offset": 1,
+            },
+        )
+        self.assertIsNone(second["next_offset"])
+
+    def test_summaries_in_batches_of_20(self):
+        calls = []
+
+        def api_get(params, language):
+            calls.append(params["pageids"].count("|") + 1)
+            return extracts_response(params, language)
+
+        page_ids = ",".join(str(page_id) for page_id in range(1, 61))
+        with patch.object(wikipedia_search, "_api_get", side_effect=api_get):
+            result = json.loads(_wikipedia_summaries(page_ids))
+
+        # At most 50 pages, at most 20 per request
+        self.assertEqual(calls, [20, 20, 10])
+        self.assertEqual(
+            [item["summary"] for item in result],
+            [f"Intro of {page_id}" for page_id in range(1, 51)],
+        )
+
+    def test_summaries_follow_continue(self):
+        calls = []
+
+        def api_get(params, language):
+            calls.append(dict(params))
+            pages = [{"pageid": 1, "title": "One", "extract": " First "}]
+            if "excontinue" in params:
+                pages = [{"pageid": 2, "title": "Two", "extract": "Second"}]
+                return {"query": {"pages": pages}}
+            pages.append({"pageid": 2, "title": "Two"})
+            return {
+                "query": {"pages": pages},
+                "continue": {"excontinue": 1, "continue": "||"},
+            }
+
+        with patch.object(wikipedia_search, "_api_get", side_effect=api_get):
+            result = json.loads(_wikipedia_summaries([2, "1", "x"]))
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0]["pageids"], "2|1")
+        self.assertEqual(calls[1]["excontinue"], 1)
+        self.assertEqual(
+            [(item["title"], item["summary"]) for item in result],
+            [("Two", "Second"), ("One", "First")],
+        )
+
+    def test_sections_outline(self):
+        api_get = MagicMock(
+            return_value={
+                "parse": {
+                    "title": "Python (programming language)",
+                    "pageid": 23862,
+                    "sections": [
+                        {"index": "1", "number": "1", "line": "History"},
+                        {"index": "T-1", "number": "1.1", "line": "From a template"},
+                        {"index": "2", "number": "2", "line": "Syntax"},
+                    ],
+                }
+            }
+        )
+        with patch.object(wikipedia_search, "_api_get", api_get):
+            outline = json.loads(_wikipedia_sections("Python_(programming  language)"))
+
+        params = api_get.call_args.args[0]
+        self.assertEqual(params["prop"], "sections")
+        self.assertEqual(params["page"], "Python (programming language)")
+        self.assertEqual(params["redirects"], 1)
+        self.assertEqual(
+            [(section["index"], section["title"]) for section in outline["sections"]],
+            [("0", "Introduction"), ("1", "History"), ("2", "Syntax")],
+        )
+
+    def test_section_text_strips_html(self):
+        text = (
+            "<style>.mw-parser-output { color: red }</style>"
+            '<h2><span class="mw-headline">History</span></h2>'
+            "<p>Python&#160;was created by Guido"
+            '<sup id="cite_ref-1" class="reference"><a href="#cite_note-1">[1]</a>'
+            "</sup> in   1991.</p><ul><li>First</li><li>Second &amp; last</li></ul>"
+            "<script>alert(1)</script>"
+        )
+        api_get = MagicMock(return_value={"parse": {"text": text}})
+        with patch.object(wikipedia_search, "_api_get", api_get):
+            result = json.loads(_wikipedia_section_text("23862", "1, 1"))
+
+        self.assertEqual(api_get.call_count, 1)
+        params = api_get.call_args.args[0]
+        self.assertEqual((params["pageid"], params["section"]), ("23862", "1"))
+        self.assertEqual(
+            result,
+            [
+                {
+                    "index": "1",
+                    "text": "History\nPython was created by Guido in 1991."
+                    "\nFirst\nSecond & last",
+                }
+            ],
+        )
+
+
+class TestWikipediaCache(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(cache, "time")
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock.time.return_value = 1000.0
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache", "wikipedia.sqlite3")
+
+    def new_cache(self, **kwargs):
+        wikipedia_cache = WikipediaCache(self.path, **kwargs)
+        self.addCleanup(wikipedia_cache._refresher.shutdown)
+        return wikipedia_cache
+
+    def test_ttl(self):
+        wikipedia_cache = self.new_cache(ttl=60)
+        fetch = MagicMock(side_effect=["first", "second"])
+
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch), "first")
+        self.clock.time.return_value += 60
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch), "first")
+        self.assertEqual(wikipedia_cache.get(("k",)), "first")
+
+        self.clock.time.return_value += 1
+        self.assertIsNone(wikipedia_cache.get(("k",)))
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch), "second")
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_stale_while_revalidate(self):
+        wikipedia_cache = self.new_cache(ttl=60, stale_ttl=60)
+        wikipedia_cache.set(("k",), "old")
+        self.clock.time.return_value += 90
+
+        release = threading.Event()
+
+        def fetch():
+            release.wait(5)
+            return "new"
+
+        fetch_mock = MagicMock(side_effect=fetch)
+        # Stale reads return at once and start a single refresh.
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch_mock), "old")
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch_mock), "old")
+        release.set()
+        wikipedia_cache._refresher.shutdown(wait=True)
+
+        fetch_mock.assert_called_once_with()
+        self.assertEqual(wikipedia_cache.get(("k",)), "new")
+
+    def test_expired_past_stale_window_is_fetched(self):
+        wikipedia_cache = self.new_cache(ttl=60, stale_ttl=60)
+        wikipedia_cache.set(("k",), "old")
+        self.clock.time.return_value += 121
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), lambda: "new"), "new")
+
+    def test_reload_from_sqlite(self):
+        first = self.new_cache(ttl=60)
+        first.set(("old",), "expires first")
+        self.clock.time.return_value += 30
+        first.set(("k", "ü"), {"value": [1, 2]})
+
+        second = self.new_cache(ttl=60)
+        fetch = MagicMock()
+        self.assertEqual(second.get_or_fetch(("k", "ü"), fetch), {"value": [1, 2]})
+        fetch.assert_not_called()
+
+        # Writing purges the rows that are past their stale window.
+        self.clock.time.return_value += 31
+        second.set(("new",), "value")
+        with second._lock:
+            rows = second._connect().execute("SELECT key FROM cache ORDER BY key")
+            keys = [row[0] for row in rows]
+        self.assertEqual(keys, ['["k", "ü"]', '["new"]'])
+
+    def test_unusable_store_keeps_entries_in_memory(self):
+        # The cache directory cannot be created, like with HOME=/etc/passwd
+        blocker = os.path.join(os.path.dirname(self.path), "file")
+        os.makedirs(os.path.dirname(blocker))
+        open(blocker, "w").close()
+        self.path = os.path.join(blocker, "wikipedia.sqlite3")
+        wikipedia_cache = self.new_cache(ttl=60)
+
+        fetch = MagicMock(return_value="value")
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch), "value")
+        self.assertEqual(wikipedia_cache.get_or_fetch(("k",), fetch), "value")
+        fetch.assert_called_once_with()
+        self.assertIsNone(wikipedia_cache.get(("missing",)))
+        wikipedia_cache.clear()
+
+    def test_failed_read_is_a_miss(self):
+        wikipedia_cache = self.new_cache(ttl=60)
+        wikipedia_cache.set(("k",), "value")
+        wikipedia_cache._memory.clear()
+        with patch.object(
+            wikipedia_cache,
+            "_connect",
+            side_effect=sqlite3.OperationalError("database is locked"),
+        ):
+            self.assertEqual(wikipedia_cache.get_or_fetch(("k",), lambda: "new"), "new")
+
+    def test_expiry_uses_index(self):
+        wikipedia_cache = self.new_cache(ttl=60)
+        wikipedia_cache.set(("k",), "value")
+        with wikipedia_cache._lock:
+            plan = wikipedia_cache._connect().execute(
+                "EXPLAIN QUERY PLAN DELETE FROM cache WHERE stored_at < 0"
+            )
+            self.assertIn("cache_stored_at", " ".join(row[-1] for row in plan))
+
+    def test_memory_tier_is_bounded(self):
+        wikipedia_cache = self.new_cache(ttl=60, max_entries=2)
+        for key in "abc":
+            wikipedia_cache.set((key,), key)
+        self.assertEqual(len(wikipedia_cache._memory), 2)
+        # The evicted entry is read back from SQLite.
+        self.assertEqual(wikipedia_cache.get(("a",)), "a")
+
+
+PAGES = [
+    (
+        10,
+        "Python (programming language)",
+        False,
+        "'''Python''' is a [[programming language]] with foo_bar support.",
+    ),
+    (11, "Monty Python", False, "'''Monty Python''' were a British comedy group."),
+    (12, "Py", True, "#REDIRECT [[Python (programming language)]]"),
+    (
+        13,
+        "Guido van Rossum",
+        False,
+        "The creator of [[Python (programming language)|Python]].",
+    ),
+    (14, "PYTHON", False, "{{Disambiguation}} Python may refer to a snake."),
+]
+
+
+def write_dump(directory, pages_per_stream=2):
+    """Write a small multistream dump and its index, return their paths."""
+    dump = [bz2.compress(b"<mediawiki><siteinfo><sitename>T</sitename></siteinfo>")]
+    index = []
+    for start in range(0, len(PAGES), pages_per_stream):
+        offset = sum(map(len, dump))
+        xml = b""
+        for page_id, title, redirect, text in PAGES[start : start + pages_per_stream]:
+            index.append(f"{offset}:{page_id}:{title}\n")
+            xml += (
+                f"<page><title>{title}</title><ns>0</ns><id>{page_id}</id>"
+                + (f'<redirect title="{title}" />' if redirect else "")
+                + f"<revision><text>{text}</text></revision></page>"
+            ).encode()
+        dump.append(bz2.compress(xml))
+    dump.append(bz2.compress(b"</mediawiki>"))
+
+    dump_path = os.path.join(directory, "dump.xml.bz2")
+    index_path = os.path.join(directory, "index.txt.bz2")
+    with open(dump_path, "wb") as f:
+        f.write(b"".join(dump))
+    with open(index_path, "wb") as f:
+        f.write(bz2.compress("".join(index).encode()))
+    return dump_path, index_path
+
+
+class TestOfflineWikipedia(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        dump_path, index_path = write_dump(directory.name)
+        self.index_dir = os.path.join(directory.name, "index")
+        build_offline_index(dump_path, index_path, self.index_dir)
+        self.offline = OfflineWikipedia(dump_path, self.index_dir)
+        self.addCleanup(self.offline._db.close)
+
+    def test_build_removes_scratch_files(self):
+        self.assertEqual(
+            sorted(os.listdir(self.index_dir)),
+            ["fulltext.sqlite3", "titles.dat", "titles.idx"],
+        )
+
+    def test_lookup(self):
+        # Titles are found in any case, the exact case wins among equal keys
+        self.assertEqual(
+            self.offline.lookup("python_(Programming  language)")[1:],
+            ("Python (programming language)", 10),
+        )
+        self.assertEqual(self.offline.lookup("PYTHON")[1:], ("PYTHON", 14))
+        self.assertIsNone(self.offline.lookup("Perl"))
+
+        stream_offset, _, page_id = self.offline.lookup("Monty Python")
+        self.assertIn(
+            "comedy group", self.offline.page_wikitext(stream_offset, page_id)
+        )
+
+    def test_search_follows_redirect(self):
+        items, _ = self.offline.search("Py", 5)
+        self.assertEqual(
+            items[0],
+            {
+                "title": "Python (programming language)",
+                "summary": "Python is a programming language with foo_bar support.",
+                "url": "http://en.wikipedia.org/?curid=10",
+            },
+        )
+
+    def test_search_exact_title_first(self):
+        items, _ = self.offline.search("Monty Python", 5)
+        titles = [item["title"] for item in items]
+        self.assertEqual(titles[0], "Monty Python")
+        self.assertEqual(len(titles), len(set(titles)))
+
+    def test_search_paging(self):
+        pages = []
+        offset = 0
+        while offset is not None:
+            items, offset = self.offline.search("python", 1, offset)
+            pages.append([item["title"] for item in items])
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(
+            sorted(title for page in pages for title in page),
+            sorted(
+                [
+                    "Python (programming language)",
+                    "Monty Python",
+                    "Guido van Rossum",
+                    "PYTHON",
+                ]
+            ),
+        )
+
+    def test_search_underscore_terms(self):
+        # "foo_bar" is two terms for FTS5, not a phrase
+        items, next_offset = self.offline.search("foo_bar", 5)
+        self.assertEqual(
+            [item["title"] for item in items], ["Python (programming language)"]
+        )
+        self.assertIsNone(next_offset)
+
+
+if __name__ == "__main__":
+    unittest.main()
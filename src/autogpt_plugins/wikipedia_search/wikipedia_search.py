@@ -1,53 +1,574 @@
 """Wikipedia search command for Autogpt."""
 from __future__ import annotations
 
+import concurrent.futures
+import html
 import json
+import os
 import re
-from urllib.parse import quote
+import threading
+from http.cookiejar import DefaultCookiePolicy
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-HTML_TAG_CLEANER = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+from .result_format import format_page, format_results
+from .snippets import normalize_snippets
+from .cache import WikipediaCache
+from .offline import OfflineWikipedia
 
+WIKIPEDIA_API_URL = "https://{language}.wikipedia.org/w/api.php"
+WIKIPEDIA_LANGUAGE = "en"
+# Language codes are part of the API host name, so only these are accepted.
+WIKIPEDIA_LANGUAGE_CODE = re.compile(r"[a-z][a-z0-9-]{1,15}")
+WIKIPEDIA_PAGE_URL = re.compile(
+    r"https?://([a-z][a-z0-9-]{1,15})\.wikipedia\.org/", re.IGNORECASE
+)
+WIKIPEDIA_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/112.0.5615.49 Safari/537.36"
+    ),
+    "Accept": "application/json",
+}
+# (connect, read) timeouts in seconds.
+WIKIPEDIA_TIMEOUT = (3.05, 10)
+WIKIPEDIA_POOL_SIZE = 10
+# Maximum `srlimit` accepted by the search API.
+WIKIPEDIA_MAX_LIMIT = 500
+# Maximum number of page IDs per query, and of intro extracts per request.
+WIKIPEDIA_MAX_PAGE_IDS = 50
+WIKIPEDIA_MAX_EXTRACTS = 20
+# Seconds to wait for each language edition in a multi-language search.
+WIKIPEDIA_LANGUAGE_DEADLINE = float(os.getenv("WIKIPEDIA_LANGUAGE_DEADLINE", "5"))
 
-def _wikipedia_search(query: str, num_results: int = 5) -> str | list[str]:
+HTML_SKIPPED_ELEMENTS = re.compile(
+    r'<(style|script)\b.*?</\1>|<sup\b[^>]*class="[^"]*reference[^"]*".*?</sup>',
+    re.DOTALL,
+)
+HTML_BLOCK_TAGS = re.compile(r"</?(p|div|br|li|h[1-6]|tr|dd|dt|table)\b[^>]*>")
+HTML_TAGS = re.compile(r"<[^>]*>")
+
+_session = None
+_session_lock = threading.Lock()
+_executor = None
+
+# Responses are cached for WIKIPEDIA_CACHE_TTL seconds, and served stale for up
+# to WIKIPEDIA_CACHE_STALE_TTL more seconds while they are refreshed in the
+# background. A TTL of 0 disables the cache.
+_cache = WikipediaCache(
+    path=os.getenv("WIKIPEDIA_CACHE_PATH")
+    or os.path.join(
+        os.path.expanduser("~"), ".cache", "autogpt_plugins", "wikipedia.sqlite3"
+    ),
+    ttl=float(os.getenv("WIKIPEDIA_CACHE_TTL", "86400")),
+    stale_ttl=float(os.getenv("WIKIPEDIA_CACHE_STALE_TTL", "604800")),
+    max_entries=int(os.getenv("WIKIPEDIA_CACHE_SIZE", "256")),
+)
+
+# Searches are answered from a local dump instead of the API when both of these
+# are set. See `offline.py` for how to build the index.
+WIKIPEDIA_OFFLINE_DUMP = os.getenv("WIKIPEDIA_OFFLINE_DUMP")
+WIKIPEDIA_OFFLINE_INDEX_DIR = os.getenv("WIKIPEDIA_OFFLINE_INDEX_DIR")
+_offline = None
+
+
+def _get_offline() -> OfflineWikipedia | None:
+    """Return the offline backend if one is configured."""
+    global _offline
+    if _offline is None and WIKIPEDIA_OFFLINE_DUMP and WIKIPEDIA_OFFLINE_INDEX_DIR:
+        with _session_lock:
+            if _offline is None:
+                _offline = OfflineWikipedia(
+                    WIKIPEDIA_OFFLINE_DUMP, WIKIPEDIA_OFFLINE_INDEX_DIR
+                )
+    return _offline
+
+
+def _get_session() -> requests.Session:
+    """Return the module-level session shared by all Wikipedia requests.
+
+    Connections are kept alive and pooled, so only the first request to a host
+    pays for DNS, TCP and TLS setup. Cookies are never stored, which leaves the
+    session without mutable state and safe to use from several threads.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=("GET",),
+                    respect_retry_after_header=True,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=WIKIPEDIA_POOL_SIZE,
+                    pool_maxsize=WIKIPEDIA_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.headers.update(WIKIPEDIA_HEADERS)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Return the thread pool shared by concurrent Wikipedia requests."""
+    global _executor
+    if _executor is None:
+        with _session_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=WIKIPEDIA_POOL_SIZE, thread_name_prefix="wikipedia"
+                )
+    return _executor
+
+
+def _api_get(params: dict, language: str = WIKIPEDIA_LANGUAGE) -> dict:
+    """Send a GET request to the Wikipedia API and return the decoded JSON."""
+    if not WIKIPEDIA_LANGUAGE_CODE.fullmatch(language):
+        raise ValueError(f"invalid Wikipedia language code: {language!r}")
+    response = _get_session().get(
+        WIKIPEDIA_API_URL.format(language=language),
+        params=params,
+        timeout=WIKIPEDIA_TIMEOUT,
+    )
+    response.raise_for_status()
+    results = response.json()
+    if "error" in results:
+        raise ValueError(results["error"].get("info", results["error"]))
+    return results
+
+
+def _wikipedia_search(
+    query: str,
+    num_results: int = 5,
+    languages: str | list | None = None,
+    output_format: str | None = None,
+) -> str | list[str]:
     """Return the results of a Wikipedia search
     Args:
         query (str): The search query.
         num_results (int): The number of results to return.
+        languages (str | list | None): Language codes of the Wikipedia
+                                       editions to search, as a list or a
+                                       comma separated string. Defaults to
+                                       English only.
+        output_format (str | None): `json`, `compact`, `jsonl` or `text`, see
+                                    `result_format.py`. Defaults to
+                                    `SEARCH_RESULT_FORMAT`.
     Returns:
-        str: The results of the search. The resulting string is a `json.dumps`
-             of a list of len `num_results` containing dictionaries with the
-             following structure: `{'title': <title>, 'summary': <summary>,
-             'url': <url to relevant page>}`
-    """
-    search_url = (
-        "https://en.wikipedia.org/w/api.php?action=query&"
-        "format=json&list=search&utf8=1&formatversion=2&"
-        f"srsearch={quote(query)}"
-    )
-    with requests.Session() as session:
-        session.headers.update({"User-Agent": ("Mozilla/5.0 (Windows NT 10.0; "
-                                               "Win64; x64) AppleWebKit/537.36 "
-                                               "(KHTML, like Gecko) Chrome/"
-                                               "112.0.5615.49 Safari/537.36")})
-        session.headers.update({"Accept": "application/json"})
-        results = session.get(search_url)
-        items = []
-        try:
-            results = results.json()
-            for item in results["query"]["search"]:
-                summary = re.sub(HTML_TAG_CLEANER, "", item["snippet"])
-                items.append(
-                    {
-                        "title": item["title"],
-                        "summary": summary,
-                        "url": f"http://en.wikipedia.org/?curid={item['pageid']}",
-                    }
+        str: The results of the search. In the JSON formats this is a list of
+             len `num_results` containing dictionaries with the following
+             structure: `{'title': <title>, 'summary': <summary>, 'url': <url
+             to relevant page>}`. When several languages are searched, each
+             result also has a `'language'` key.
+    """
+    try:
+        languages = _parse_languages(languages)
+        if len(languages) == 1:
+            items, _ = _search_page(query, int(num_results), language=languages[0])
+        else:
+            items = _search_languages(query, int(num_results), languages)
+        return format_results(items, output_format)
+    except Exception as e:
+        return f"'wikipedia_search' on query: {query} raised exception: {e}"
+
+
+def _parse_languages(languages: str | list | None) -> list[str]:
+    if not languages:
+        return [WIKIPEDIA_LANGUAGE]
+    if isinstance(languages, str):
+        languages = languages.split(",")
+    languages = [language.strip().lower() for language in languages]
+    languages = list(dict.fromkeys(language for language in languages if language))
+    for language in languages:
+        if not WIKIPEDIA_LANGUAGE_CODE.fullmatch(language):
+            raise ValueError(f"invalid Wikipedia language code: {language!r}")
+    return languages or [WIKIPEDIA_LANGUAGE]
+
+
+def _search_languages(query: str, num_results: int, languages: list[str]) -> list:
+    """Search several language editions concurrently and merge the results.
+
+    Results are interleaved by rank, in the order the languages are given, and
+    articles about the same Wikidata item are only returned once. Languages
+    that have not answered within `WIKIPEDIA_LANGUAGE_DEADLINE` are left out.
+    """
+    futures = {
+        language: _get_executor().submit(
+            _search_page, query, num_results, language=language, wikidata=True
+        )
+        for language in languages
+    }
+    concurrent.futures.wait(futures.values(), timeout=WIKIPEDIA_LANGUAGE_DEADLINE)
+
+    results = {}
+    errors = []
+    for language, future in futures.items():
+        if not future.done():
+            continue
+        if future.exception() is not None:
+            errors.append(future.exception())
+            continue
+        results[language] = future.result()[0]
+    if errors and not results:
+        raise errors[0]
+
+    items = []
+    seen = set()
+    for rank in range(num_results):
+        for language, language_items in results.items():
+            if rank >= len(language_items):
+                continue
+            item = dict(language_items[rank])
+            wikidata = item.pop("wikidata", None)
+            if wikidata is not None:
+                if wikidata in seen:
+                    continue
+                seen.add(wikidata)
+            items.append({**item, "language": language})
+    return items[:num_results]
+
+
+def _wikipedia_search_paged(
+    query: str,
+    num_results: int = 5,
+    offset: int = 0,
+    output_format: str | None = None,
+) -> str:
+    """Return one page of the results of a Wikipedia search
+    Args:
+        query (str): The search query.
+        num_results (int): The number of results per page.
+        offset (int): The offset of the page, as returned in `next_offset` by
+                      the previous page.
+        output_format (str | None): `json`, `compact`, `jsonl` or `text`, see
+                                    `result_format.py`. Defaults to
+                                    `SEARCH_RESULT_FORMAT`.
+    Returns:
+        str: The page of results. In the JSON formats this is a dictionary
+             with the following structure: `{'results': <results in the
+             format of `_wikipedia_search`>, 'next_offset': <offset of the
+             next page, or None if there are no more results>}`. `jsonl` and
+             `text` end with a line holding `next_offset`.
+    """
+    try:
+        items, next_offset = _search_page(query, int(num_results), int(offset))
+        return format_page(items, next_offset, output_format)
+    except Exception as e:
+        return f"'wikipedia_search_paged' on query: {query} raised exception: {e}"
+
+
+def _wikipedia_summaries(page_ids: str | list) -> str:
+    """Return the plain text introductions of Wikipedia pages
+    Args:
+        page_ids (str | list): Up to 50 page IDs or `?curid=` URLs as returned
+                               by `_wikipedia_search`, as a list or a comma
+                               separated string. Plain IDs refer to English
+                               pages, URLs to the edition of their host.
+    Returns:
+        str: The summaries. The resulting string is a `json.dumps` of a list
+             containing dictionaries with the following structure:
+             `{'title': <title>, 'summary': <introduction>, 'url': <url to
+             the page>}`
+    """
+    try:
+        pages = _parse_page_ids(page_ids)[:WIKIPEDIA_MAX_PAGE_IDS]
+        extracts = {}
+        missing = {}
+        for language, page_id in pages:
+            extract = _cache.get(("extract", language, page_id))
+            if extract is None:
+                missing.setdefault(language, []).append(page_id)
+            else:
+                extracts[language, page_id] = extract
+
+        for language, ids in missing.items():
+            for i in range(0, len(ids), WIKIPEDIA_MAX_EXTRACTS):
+                fetched = _fetch_extracts(
+                    ids[i : i + WIKIPEDIA_MAX_EXTRACTS], language
                 )
-                if len(items) == num_results:
-                    break
-        except Exception as e:
-            return f"'wikipedia_search' on query: {query} raised exception: {e}"
+                for page_id, extract in fetched.items():
+                    _cache.set(("extract", language, page_id), extract)
+                    extracts[language, page_id] = extract
+    except Exception as e:
+        return f"'wikipedia_summaries' on pages: {page_ids} raised exception: {e}"
+
+    items = [
+        {
+            "title": extracts[page]["title"],
+            "summary": extracts[page]["extract"],
+            "url": f"http://{page[0]}.wikipedia.org/?curid={page[1]}",
+        }
+        for page in pages
+        if page in extracts
+    ]
+    return json.dumps(items, ensure_ascii=False, indent=4)
+
+
+def _parse_page_ids(page_ids: str | list) -> list[tuple[str, int]]:
+    """Return the `(language, page ID)` pairs of page IDs and URLs."""
+    if isinstance(page_ids, str):
+        page_ids = page_ids.split(",")
+    pages = []
+    for page_id in page_ids:
+        language = _page_language(page_id)
+        page_id = str(page_id).strip().rsplit("curid=", 1)[-1]
+        if page_id.isdigit() and (language, int(page_id)) not in pages:
+            pages.append((language, int(page_id)))
+    return pages
+
+
+def _page_language(page: str) -> str:
+    """Return the language edition of a page URL, English for anything else."""
+    match = WIKIPEDIA_PAGE_URL.match(str(page).strip())
+    return match.group(1).lower() if match else WIKIPEDIA_LANGUAGE
+
+
+def _fetch_extracts(
+    page_ids: list[int], language: str = WIKIPEDIA_LANGUAGE
+) -> dict[int, dict]:
+    """Request the intro extracts of up to 20 pages in one query."""
+    params = {
+        "action": "query",
+        "format": "json",
+        "prop": "extracts",
+        "exintro": 1,
+        "explaintext": 1,
+        "exlimit": "max",
+        "utf8": 1,
+        "formatversion": 2,
+        "pageids": "|".join(map(str, page_ids)),
+    }
+    extracts = {}
+    while True:
+        results = _api_get(params, language)
+        for page in results["query"]["pages"]:
+            if "extract" in page:
+                extracts[page["pageid"]] = {
+                    "title": page["title"],
+                    "extract": page["extract"].strip(),
+                }
+        if "continue" not in results:
+            return extracts
+        params.update(results["continue"])
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def _search_page(
+    query: str,
+    num_results: int,
+    offset: int = 0,
+    language: str = WIKIPEDIA_LANGUAGE,
+    wikidata: bool = False,
+) -> tuple[list[dict], int | None]:
+    """Return a single page of search results, from the local dump if one is
+    configured, else from the cache if possible."""
+    offline = _get_offline()
+    if offline is not None and language == WIKIPEDIA_LANGUAGE and not wikidata:
+        return offline.search(query, num_results, offset)
+
+    key = (
+        "search",
+        _normalize_query(query),
+        language,
+        num_results,
+        offset,
+        wikidata,
+    )
+    items, next_offset = _cache.get_or_fetch(
+        key,
+        lambda: _fetch_search_page(query, num_results, offset, language, wikidata),
+    )
+    return items, next_offset
+
+
+def _fetch_search_page(
+    query: str,
+    num_results: int,
+    offset: int = 0,
+    language: str = WIKIPEDIA_LANGUAGE,
+    wikidata: bool = False,
+) -> tuple[list[dict], int | None]:
+    """Request a single page of search results.
+
+    Only the number of results that is needed is requested, and only the
+    snippet is asked for on top of the title and page ID, which are always
+    included. With `wikidata`, the same search also runs as a generator for
+    `pageprops`, which adds the Wikidata ID of each page in the same request.
+    """
+    num_results = max(1, min(num_results, WIKIPEDIA_MAX_LIMIT))
+    params = {
+        "action": "query",
+        "format": "json",
+        "list": "search",
+        "utf8": 1,
+        "formatversion": 2,
+        "srsearch": query,
+        "srlimit": num_results,
+        "srprop": "snippet",
+    }
+    if offset:
+        params["sroffset"] = offset
+    if wikidata:
+        params.update(
+            {
+                "generator": "search",
+                "gsrsearch": query,
+                "gsrlimit": num_results,
+                "gsroffset": offset,
+                "prop": "pageprops",
+                "ppprop": "wikibase_item",
+            }
+        )
+
+    results = _api_get(params, language)
+    summaries = normalize_snippets(
+        [item["snippet"] for item in results["query"]["search"]]
+    )
+    items = [
+        {
+            "title": item["title"],
+            "summary": summary,
+            "url": f"http://{language}.wikipedia.org/?curid={item['pageid']}",
+        }
+        for item, summary in zip(results["query"]["search"], summaries)
+    ]
+    if wikidata:
+        wikidata_ids = {
+            page["pageid"]: page.get("pageprops", {}).get("wikibase_item")
+            for page in results["query"].get("pages", [])
+        }
+        for item, result in zip(items, results["query"]["search"]):
+            item["wikidata"] = wikidata_ids.get(result["pageid"])
+    next_offset = results.get("continue", {}).get("sroffset")
+    return items, next_offset
+
+
+def _wikipedia_sections(page: str) -> str:
+    """Return the section outline of a Wikipedia article
+    Args:
+        page (str): The title of the article, its page ID or its `?curid=` URL.
+                    Titles and IDs refer to English articles, URLs to the
+                    edition of their host.
+    Returns:
+        str: The outline. The resulting string is a `json.dumps` of a
+             dictionary with the following structure: `{'title': <title>,
+             'pageid': <page ID>, 'sections': [{'index': <index to pass to
+             `_wikipedia_section_text`>, 'number': <section number>,
+             'title': <section heading>}]}`. Index 0 is the introduction.
+    """
+    try:
+        outline = _cache.get_or_fetch(
+            ("sections", _page_language(page), _normalize_page(page)),
+            lambda: _fetch_sections(page),
+        )
+    except Exception as e:
+        return f"'wikipedia_sections' on page: {page} raised exception: {e}"
+
+    return json.dumps(outline, ensure_ascii=False, indent=4)
+
+
+def _wikipedia_section_text(page: str, sections: str | list) -> str:
+    """Return the plain text of selected sections of a Wikipedia article
+    Args:
+        page (str): The title of the article, its page ID or its `?curid=` URL.
+        sections (str | list): Section indexes from `_wikipedia_sections`, as
+                               a list or a comma separated string.
+    Returns:
+        str: The sections. The resulting string is a `json.dumps` of a list
+             containing dictionaries with the following structure:
+             `{'index': <index>, 'text': <plain text of the section>}`
+    """
+    try:
+        if isinstance(sections, str):
+            sections = sections.split(",")
+        indexes = list(dict.fromkeys(str(index).strip() for index in sections))
+        texts = list(
+            _get_executor().map(lambda index: _section_text(page, index), indexes)
+        )
+    except Exception as e:
+        return f"'wikipedia_section_text' on page: {page} raised exception: {e}"
+
+    items = [{"index": index, "text": text} for index, text in zip(indexes, texts)]
+    return json.dumps(items, ensure_ascii=False, indent=4)
+
+
+def _normalize_page(page: str) -> str:
+    page = str(page).strip().rsplit("curid=", 1)[-1]
+    return page if page.isdigit() else " ".join(page.replace("_", " ").split())
+
+
+def _page_params(page: str) -> dict:
+    page = _normalize_page(page)
+    if page.isdigit():
+        return {"pageid": page}
+    return {"page": page, "redirects": 1}
+
+
+def _fetch_sections(page: str) -> dict:
+    params = {
+        "action": "parse",
+        "format": "json",
+        "prop": "sections",
+        "utf8": 1,
+        "formatversion": 2,
+        **_page_params(page),
+    }
+    parsed = _api_get(params, _page_language(page))["parse"]
+    return {
+        "title": parsed["title"],
+        "pageid": parsed["pageid"],
+        "sections": [{"index": "0", "number": "0", "title": "Introduction"}]
+        + [
+            {
+                "index": section["index"],
+                "number": section["number"],
+                "title": section["line"],
+            }
+            for section in parsed["sections"]
+            # Sections transcluded from templates cannot be fetched by index.
+            if section["index"].isdigit()
+        ],
+    }
+
+
+def _section_text(page: str, index: str) -> str:
+    return _cache.get_or_fetch(
+        ("section", _page_language(page), _normalize_page(page), index),
+        lambda: _fetch_section_text(page, index),
+    )
+
+
+def _fetch_section_text(page: str, index: str) -> str:
+    params = {
+        "action": "parse",
+        "format": "json",
+        "prop": "text",
+        "section": index,
+        "disableeditsection": 1,
+        "disabletoc": 1,
+        "disablelimitreport": 1,
+        "utf8": 1,
+        "formatversion": 2,
+        **_page_params(page),
+    }
+    return _html_to_text(_api_get(params, _page_language(page))["parse"]["text"])
+
 
-    return json.dumps(items, ensure_ascii=False, indent=4)
\ No newline at end of file
+def _html_to_text(text: str) -> str:
+    text = HTML_SKIPPED_ELEMENTS.sub("", text)
+    text = HTML_BLOCK_TAGS.sub("\n", text)
+    text = html.unescape(HTML_TAGS.sub("", text))
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)